@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# vim: set fileencoding=utf-8 fileformat=unix :
+
+# Copyright (C) 2013 HAYASHI Hideki <hideki@hayasix.com>  All rights reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL). A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+
+"""{script}: Benchmarks for romaja
+
+Usage: {script} [options] [BENCH...]
+
+BENCH is one or more of: import, roma, iso, kana, hk, cli, many
+[default: all]
+
+Options:
+  -h, --help            show this
+  -n, --repeat N        take the best of N runs [default: 5]
+  --size N              number of words in the long text corpus
+                        [default: 20000]
+  --seed N              random seed for the long text corpus [default: 0]
+  -o, --output FILE     write results to FILE instead of stdout
+
+Results are written in JSON: for each benchmark, the number of words,
+the best time in seconds, words per second and peak memory in bytes
+(traced allocations in process, or max RSS for the commands).  'many'
+times roma_many() and katakana_many() on 1, 2, 4... threads up to the
+number of CPUs, with the speedup over 1 thread; threads scale only on
+free-threaded CPython, which is shown as 'gil' in the results.
+"""
+
+
+import sys
+import os
+import json
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import docopt
+
+import romaja
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BENCHES = ("import", "roma", "iso", "kana", "hk", "cli", "many")
+
+
+def best(func, repeat):
+    """Return the shortest time in seconds taken by `func()`."""
+    result = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func()
+        result = min(result, time.perf_counter() - t)
+    return result
+
+
+def peak(func):
+    """Return the peak memory in bytes allocated during `func()`."""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(func, words, repeat):
+    """Measure `func` applied to each of `words`."""
+    run = lambda: [func(w) for w in words]
+    seconds = best(run, repeat)
+    return dict(words=len(words), seconds=seconds,
+                words_per_sec=len(words) / seconds, peak_bytes=peak(run))
+
+
+def corpus(size, seed=0):
+    """Return names in names.csv and generated long kana words."""
+    kana = [k for k in romaja.KR if k != "〓"] + list("ンッーャュョァィェ")
+    rnd = random.Random(seed)
+    texts = ["".join(rnd.choice(kana) for _ in range(rnd.randint(8, 40)))
+             for _ in range(size)]
+    return dict(names=list(romaja.names()), text=texts)
+
+
+def spawn(args, **kwargs):
+    return subprocess.run([sys.executable] + args, cwd=HERE, check=True,
+                          **kwargs)
+
+
+RSS = """\
+import sys, resource, romaja
+sys.argv[1:] = {!r}
+romaja.main()
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(rss if sys.platform == "darwin" else rss * 1024, file=sys.stderr)
+"""
+
+
+def peak_rss(args, **kwargs):
+    """Return the peak RSS in bytes of the romaja command with `args`."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    proc = spawn(["-c", RSS.format(args)], stderr=subprocess.PIPE,
+                 universal_newlines=True, **kwargs)
+    return int(proc.stderr.split()[-1])
+
+
+def bench_import(corpora, repeat):
+    """Time importing romaja, and loading names with and without index."""
+    romaja.loadnames()  # make sure the index is up to date
+    return {
+        "import": dict(seconds=best(
+                lambda: spawn(["-c", "import romaja"]), repeat)),
+        "import+names": dict(seconds=best(
+                lambda: spawn(["-c", "import romaja; romaja.names()"]),
+                repeat)),
+        "names.index": dict(seconds=best(romaja.loadnames, repeat)),
+        "names.csv": dict(seconds=best(
+                lambda: romaja._buildindex([romaja.NAMESFILE], []), repeat)),
+        }
+
+
+def bench_roma(corpora, repeat):
+    """Time roma() for every system, with and without composite/name."""
+    result = dict()
+    for system in romaja.RECIPE:
+        for composite in (False, True):
+            for name in (False, True):
+                for (cname, words) in corpora.items():
+                    key = "roma.{}{}{}.{}".format(
+                            system, ".composite" if composite else "",
+                            ".name" if name else "", cname)
+                    result[key] = measure(
+                            lambda w: romaja.roma(w, system, composite, name),
+                            words, repeat)
+    return result
+
+
+def bench_iso(corpora, repeat):
+    """Time iso3602() on katakana."""
+    result = dict()
+    for (cname, words) in corpora.items():
+        words = [romaja.h2k(w) for w in words]
+        for name in (False, True):
+            key = "iso3602{}.{}".format(".name" if name else "", cname)
+            result[key] = measure(lambda w: romaja.iso3602(w, name),
+                                  words, repeat)
+    return result
+
+
+def bench_kana(corpora, repeat):
+    """Time katakana() and hiragana() on romaji of several systems."""
+    result = dict()
+    for (cname, words) in corpora.items():
+        for system in ("ANSI", "ISO", "HEPBURN", "MOFA"):
+            romaji = [romaja.roma(w, system) for w in words]
+            for func in (romaja.katakana, romaja.hiragana):
+                for (mofa, long_h) in ((False, False), (True, True)):
+                    key = "{}{}{}.{}.{}".format(
+                            func.__name__, ".mofa" if mofa else "",
+                            ".long_h" if long_h else "", system, cname)
+                    result[key] = measure(
+                            lambda w: func(w, mofa, long_h), romaji, repeat)
+    return result
+
+
+def bench_hk(corpora, repeat):
+    """Time h2k() and k2h()."""
+    result = dict()
+    for (cname, words) in corpora.items():
+        result["h2k." + cname] = measure(romaja.h2k, words, repeat)
+        katakana = [romaja.h2k(w) for w in words]
+        result["k2h." + cname] = measure(romaja.k2h, katakana, repeat)
+    return result
+
+
+def bench_cli(corpora, repeat):
+    """Time the romaja/jaroma commands end to end on files."""
+    result = dict()
+    script = os.path.join(HERE, "romaja.py")
+    with tempfile.TemporaryDirectory() as temp:
+        for (cname, words) in corpora.items():
+            source = os.path.join(temp, cname + ".txt")
+            with open(source, "w", encoding="utf-8") as out:
+                for p in range(0, len(words), 8):
+                    out.write(" ".join(words[p:p + 8]) + "\n")
+            romaji = os.path.join(temp, cname + ".roma.txt")
+            env = dict(os.environ, PYTHONIOENCODING="utf-8")
+            spawn([script, "-i", source, "-o", romaji], env=env)
+            for (label, args) in (("romaja", ["-i", source]),
+                                  ("jaroma", ["-r", "-i", romaji])):
+                args = args + ["-o", os.devnull]
+                seconds = best(lambda: spawn([script] + args, env=env),
+                               repeat)
+                result["cli.{}.{}".format(label, cname)] = dict(
+                        words=len(words), seconds=seconds,
+                        words_per_sec=len(words) / seconds,
+                        peak_bytes=peak_rss(args, env=env))
+    return result
+
+
+def bench_many(corpora, repeat):
+    """Time roma_many() and katakana_many() on increasing threads."""
+    from concurrent.futures import ThreadPoolExecutor
+    cpus = os.cpu_count() or 1
+    threads = sorted(set([1 << k for k in range(cpus.bit_length())] +
+                         [cpus]))
+    result = dict()
+    for (cname, words) in corpora.items():
+        romaji = [romaja.roma(w) for w in words]
+        for (func, data) in ((romaja.roma_many, words),
+                             (romaja.katakana_many, romaji)):
+            single = None
+            for n in threads:
+                with ThreadPoolExecutor(n) as executor:
+                    seconds = best(
+                            lambda: list(func(data, executor=executor)),
+                            repeat)
+                single = single or seconds
+                result["{}.{}.{}".format(func.__name__, n, cname)] = dict(
+                        threads=n, words=len(data), seconds=seconds,
+                        words_per_sec=len(data) / seconds,
+                        speedup=single / seconds)
+    return result
+
+
+def main():
+    args = docopt.docopt(__doc__.format(script=os.path.basename(__file__)))
+    repeat = int(args["--repeat"])
+    benches = args["BENCH"] or BENCHES
+    for bench in benches:
+        if bench not in BENCHES:
+            raise ValueError("valid benchmarks are: " + ",".join(BENCHES))
+    romaja.set_cache(0)
+    corpora = corpus(int(args["--size"]), int(args["--seed"]))
+    result = dict(
+            version=romaja.__version__,
+            python=platform.python_version(),
+            implementation=platform.python_implementation(),
+            machine=platform.machine(),
+            gil=getattr(sys, "_is_gil_enabled", lambda: True)(),
+            results=dict())
+    for bench in benches:
+        func = globals()["bench_" + bench]
+        result["results"].update(func(corpora, repeat))
+    if args["--output"]:
+        with open(args["--output"], "w") as out:
+            json.dump(result, out, indent=2)
+    else:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
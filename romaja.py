@@ -12,19 +12,49 @@
 
 """{script}: Japanese Kana Romanizer
 
-Usage: {script} [options] [WORD...]
+Usage: {script} serve [options]
+       {script} [options] [WORD...]
 
 Options:
   -h, --help            show this
   --version             show version
   -r, --reverse         romanize hiragana/katakana
+  --cache SIZE          memoize up to SIZE conversions [default: 0]
+  -j, --jobs N          convert stdin in N processes; 0 for all CPUs
+                        [default: 1]
+  -i, --input FILE      read FILE instead of stdin
+  -o, --output FILE     write to FILE instead of stdout
+  -f, --format FMT      'text' | 'csv' | 'tsv' | 'jsonl' [default: text]
+  --fields LIST         comma-separated names or numbers of the fields to
+                        convert in records; all fields if omitted
+  --header              the first row of CSV/TSV is a header
+  --append              append converted fields instead of replacing
+  --stats               print time spent in each stage to stderr; with
+                        serve, print latency percentiles on exit
+
+Options for serve (JSON-lines service):
+  --socket PATH         listen on Unix socket PATH
+  --port N              listen on TCP port N
+  --host HOST           listen on HOST with --port [default: 127.0.0.1]
+  --batch N             convert up to N requests at a time [default: 256]
 
 Options for romanization (katakana/hiragana -> romanized):
   -s, --system NAME     'ANSI' | 'ISO' | 'HEPBURN' | 'KUNREI2' |
                         'ROAD' | 'RAIL' | 'MOFA' [default: ANSI]
   -k, --kunrei          adopt ISO3602:1989 aka Kunrei-shiki
   -K, --kunrei2         adopt Kunrei-shiki with table 2
+  -S, --systems LIST    convert into each of comma-separated systems, in
+                        columns separated by TAB, or in fields appended
+                        to records
   --name                special conversion for names
+  --fullname            convert each line or field as a full name,
+                        splitting it into family and given names
+  --names FILES         stack dictionaries of names in CSV over names.csv;
+                        FILES are separated by os.pathsep (':' or ';')
+  -m, --mixed           convert only runs of kana in text, passing the
+                        other chars and whitespace through
+  --normalize           normalize half-width katakana, voiced sound marks
+                        and iteration marks first
   --long SYMBOL         subst char for long vowel [default: ~]
                         'NO' for nothing; '+' to double vowel
   --sep SYMBOL          subst char after n before vowels [default: ']
@@ -32,6 +62,7 @@ Options for romanization (katakana/hiragana -> romanized):
   --m4n                 replace n before b/m/p with m
   -X, --no-extend       do not allow non-native pronounciation
   -c --composite        use composite chars
+  --case CASE           'upper' | 'lower' | 'title' [default: upper]
   --test                test this program
 
 Options for deromanization (romanized -> katakana/hiragana):
@@ -44,10 +75,25 @@ Options for deromanization (romanized -> katakana/hiragana):
 import sys
 import os
 import re
+import functools
+import array
+import marshal
+import mmap
+import struct
+import zlib
+import time
+import io
+import csv
+import json
+import itertools
+import threading
+import contextlib
+from collections import namedtuple
+from collections.abc import Mapping, Sequence
+from types import MappingProxyType
+import unicodedata
 from unicodedata import lookup
 
-import docopt
-
 
 __version__ = "3.2.3"
 __author__ = "HAYASHI Hideki"
@@ -56,7 +102,14 @@ __license__ = "ZPL 2.1"
 __email__ = "hideki@hayasix.com"
 __status__ = "Production"
 
-__all__ = ("roma", "romazi", "romaji", "katakana", "hiragana")
+__all__ = ("roma", "romazi", "romaji", "katakana", "hiragana",
+           "roma_text", "roma_all", "roma_fullname", "segmentname",
+           "roma_column", "katakana_column", "roma_many", "katakana_many",
+           "searchkey", "SearchIndex",
+           "normkana", "set_names",
+           "Romanizer", "Deromanizer", "Transliterator", "KanaInput",
+           "set_cache", "cache_info", "cache_clear",
+           "set_stats", "stats", "stats_clear")
 
 
 VOWELS = "AIUEO"
@@ -80,6 +133,9 @@ KT = dict(
         )
 KR = dict((k[v], c + VOWELS[v]) for (c, k) in list(KT.items())
                                  for v in range(5))
+# Tables are read-only, so that compiled conversions and the plain
+# pipeline which they fall back on always agree, even across threads.
+(KT, KR) = (MappingProxyType(KT), MappingProxyType(KR))
 RECIPE = { # system: (long, sep, m4n, extend)
     "ANSI":    dict(long="~", sep="'", m4n=False, extend=True),
     "HEPBURN": dict(long="+", sep="-", m4n=True, extend=True),
@@ -90,6 +146,8 @@ RECIPE = { # system: (long, sep, m4n, extend)
     "MOFAH":   dict(long="+", sep="'", m4n=True, extend=False),
     "ISO":     dict(long="^", sep="'", m4n=False, extend=False),
     }
+RECIPE = MappingProxyType(dict(
+        (system, MappingProxyType(spec)) for (system, spec) in RECIPE.items()))
 ACCENTNAME = {
     "~":    "MACRON",
     "^":    "CIRCUMFLEX",
@@ -111,7 +169,11 @@ RK = {
     "d": ("デャ","ディ","デュ","デェ","デョ"),
     "s": ("ツァ","ツィ","ツ","ツェ","ツォ"),
     }
+RK = MappingProxyType(RK)  # read-only as KR
 HKGAP = ord("ァ") - ord("ぁ")
+H2K = dict((c, c + HKGAP) for c in list(range(ord("ぁ"), ord("ゖ") + 1)) +
+                                   list(range(ord("ゝ"), ord("ゞ") + 1)))
+K2H = dict((k, h) for (h, k) in H2K.items())
 
 
 def _translate(s, in_, out):
@@ -128,30 +190,396 @@ def is_katakana(c):
     return "ァ" <= c <= "ヶ" or "ヽ" <= c <= "ヾ"
 
 
+# A run of chars for which is_hiragana() or is_katakana() holds,
+# followed by any prolonged sound marks.
+KANARUN = re.compile("[ぁ-ゖゝゞァ-ヶヽヾ][ぁ-ゖゝゞァ-ヶヽヾー]*")
+
+
 def h2k(s):
-    return "".join(chr(ord(c) + HKGAP) if is_hiragana(c) else c for c in s)
+    return s.translate(H2K)
 
 
 def k2h(s):
-    return "".join(chr(ord(c) - HKGAP) if is_katakana(c) else c for c in s)
+    return s.translate(K2H)
+
+
+# Half-width katakana and voiced sound marks to full-width, where voiced
+# sound marks become combining ones.
+HALFWIDTH = dict((c, unicodedata.normalize("NFKC", chr(c)))
+                 for c in range(0xFF61, 0xFFA0))
+MARKS = dict(zip("\u3099\u309b\u309a\u309c",
+                 "\u3099\u3099\u309a\u309a"))
+COMPOSE = dict((c + m, unicodedata.normalize("NFC", c + MARKS[m]))
+               for c in map(chr, list(range(ord("ぁ"), ord("ゖ") + 1)) +
+                                 list(range(ord("ァ"), ord("ヺ") + 1)) +
+                                 [ord("ゝ"), ord("ヽ")])
+               for m in MARKS
+               if len(unicodedata.normalize("NFC", c + MARKS[m])) == 1)
+VOICED = dict((k[0], v) for (k, v) in COMPOSE.items() if k[1] == "\u3099")
+UNVOICED = dict((v, k[0]) for (k, v) in COMPOSE.items())
+ITERATION = dict(ゝ=False, ゞ=True, ヽ=False, ヾ=True)  # voiced or not
+NORMRUN = re.compile("(.)(?=[\u3099-\u309cゝゞヽヾ])"
+                     "([\u3099-\u309c]?)([ゝゞヽヾ]*)")
+
+
+def _normrun(m):
+    (c, mark, marks) = m.groups()
+    if mark: c = COMPOSE.get(c + mark, c + mark)
+    if not marks: return c
+    if len(c) != 1 or not ("ぁ" <= c <= "ゖ" or "ァ" <= c <= "ヺ"):
+        return c + marks  # nothing to repeat
+    base = UNVOICED.get(c, c)
+    return c + "".join(VOICED.get(base, base) if ITERATION[i] else base
+                       for i in marks)
+
+
+def normkana(s):
+    """Normalize half-width katakana, voiced sound marks and iteration marks.
+
+    s           (unicode) source text, a word or a whole buffer
+
+    Half-width katakana and punctuation are made full-width, kana with
+    combining or spacing (semi-)voiced sound marks are composed, and the
+    iteration marks ゝゞヽヾ following kana are replaced by the kana they
+    repeat.  The text is converted by a translation table and a single
+    regex pass, and the other chars are left as they are.
+
+    Test:
+    >>> assert normkana("ｼﾝﾊﾞｼ ｶｰﾄﾞ｡") == "シンバシ カード。"
+    >>> assert normkana("か\u3099か゛ウ゛ハ゜") == "ががヴパ"
+    >>> assert normkana("いすゞ こゝろ バヽ ハヾ") == "いすず こころ バハ ハバ"
+    >>> assert normkana("ゝ 々 ア゛") == "ゝ 々 ア゛"
+    >>> assert normkana("ぱゞ ぱゝ") == "ぱば ぱは"
+    >>> assert normkana("こ ゝ 漢ゝ 1ヾ ーゝ ア゛ヽ") == "こ ゝ 漢ゝ 1ヾ ーゝ ア゛ヽ"
+    """
+    return NORMRUN.sub(_normrun, s.translate(HALFWIDTH))
+
+
+NAMESFILE = os.path.join(os.path.dirname(__file__), "names.csv")
+NAMESCHECK = 2.0  # seconds between checks for modified dictionaries
+_nameslock = threading.Lock()
+_namesfiles = (NAMESFILE,)
+_nameindex = None
+_namesdue = 0.0  # when to check for modified dictionaries next
+
+
+FAMILY, GIVEN = 1, 2
+
+
+def _parsenames(path):
+    names = dict()
+    kinds = dict()
+    kind = FAMILY | GIVEN
+    with open(path, "r", encoding="utf-8-sig") as in_:
+        for line in in_:
+            (line, _, comment) = line.partition("#")
+            if "family" in comment.lower(): kind = FAMILY
+            elif "given" in comment.lower(): kind = GIVEN
+            line = line.strip()
+            if not line: continue
+            kana, roma = [s.strip() for s in line.split(",", 1)]
+            kana = h2k(kana)
+            names[kana] = _translate(roma.upper(),
+                                     "Â Î Û Ê Ô", "A^ I^ U^ E^ O^")
+            kinds[kana] = kinds.get(kana, 0) | kind
+    return (names, kinds)
+
+
+def _maketrie(words):
+    """Return a compact prefix trie of `words`.
+
+    words       (dict) word -> flags (int)
+
+    The trie is a tuple of three lists indexed by node, where node 0 is
+    the root: the chars of edges to children, the node of the first
+    child, and the flags of the word which ends at the node, if any.
+    Children are numbered consecutively in the order of the chars.
+    """
+    root = dict()
+    for (word, flags) in words.items():
+        node = root
+        for c in word:
+            node = node.setdefault(c, dict())
+        node[""] = flags
+    (labels, first, flags) = ([], [], [])
+    queue = [root]
+    for node in queue:
+        chars = "".join(sorted(c for c in node if c))
+        labels.append(chars)
+        first.append(len(queue))
+        flags.append(node.get("", 0))
+        queue.extend(node[c] for c in chars)
+    return (labels, first, flags)
+
+
+def _walk(trie, chars):
+    """Yield (length, flags) of each word in `trie` which prefixes `chars`."""
+    (labels, first, flags) = trie
+    node = 0
+    for (n, c) in enumerate(chars, 1):
+        i = labels[node].find(c)
+        if i < 0: return
+        node = first[node] + i
+        if flags[node]: yield (n, flags[node])
+
+
+INDEXMAGIC = b"RJNAMES1"
+UINT = struct.Struct("=I")
+
+
+def _stamps(paths):
+    stamps = []
+    for path in paths:
+        st = os.stat(path)
+        stamps.append((path, st.st_size, st.st_mtime_ns))
+    return stamps
+
+
+def _indexpath(paths):
+    tag = sys.implementation.cache_tag
+    if not tag: return None
+    (head, tail) = os.path.split(paths[-1])
+    stem = os.path.splitext(tail)[0]
+    if len(paths) > 1:
+        stem += "+{:08x}".format(zlib.crc32("\0".join(paths).encode("utf-8")))
+    return os.path.join(head, "__pycache__", "{}.{}.idx".format(stem, tag))
+
+
+def _buildindex(paths, stamps):
+    """Return the index of names in CSV files `paths` as bytes.
+
+    The index consists of a header, a hash table of offsets of entries
+    in open addressing, the size and the entries of kana and romaji in
+    UTF-8 preceded by their lengths in bytes, and the prefix tries of
+    names in marshal format.  Numbers are in native byte order.
+    """
+    (names, kinds) = (dict(), dict())
+    for path in paths:
+        (n, k) = _parsenames(path)
+        names.update(n)
+        kinds.update(k)
+    nslots = 1 << (2 * len(names)).bit_length()
+    tries = (_maketrie(kinds),
+             _maketrie(dict((k[::-1], v) for (k, v) in kinds.items())))
+    header = marshal.dumps((stamps, len(names), nslots))
+    offset = len(INDEXMAGIC) + UINT.size * (nslots + 2) + len(header)
+    slots = array.array("I", bytes(UINT.size * nslots))
+    entries = bytearray()
+    for (kana, romaji) in names.items():
+        (kana, romaji) = (kana.encode("utf-8"), romaji.encode("utf-8"))
+        if max(len(kana), len(romaji)) > 255:
+            raise ValueError("too long name: " + kana.decode("utf-8"))
+        i = zlib.crc32(kana) & (nslots - 1)
+        while slots[i]: i = (i + 1) & (nslots - 1)
+        slots[i] = offset + len(entries)
+        entries += bytes((len(kana), len(romaji))) + kana + romaji
+    return b"".join((INDEXMAGIC, UINT.pack(len(header)), header,
+                     slots.tobytes(), UINT.pack(len(entries)), entries,
+                     marshal.dumps(tries)))
+
+
+class NameIndex(Mapping):
+
+    """Read-only mapping of katakana to romaji in a compiled index.
+
+    buf         (bytes|mmap) index made of CSV files of names
+
+    Names are looked up in `buf` in place, so that processes which map
+    the same index file share a single copy of it.
+    """
+
+    def __init__(self, buf):
+        if buf[:len(INDEXMAGIC)] != INDEXMAGIC:
+            raise ValueError("not an index of names")
+        p = len(INDEXMAGIC) + UINT.size
+        n = UINT.unpack_from(buf, p - UINT.size)[0]
+        (self.stamps, self._len, nslots) = marshal.loads(buf[p:p + n])
+        p += n
+        self._buf = buf
+        self._mask = nslots - 1
+        self._slots = memoryview(buf)[p:p + UINT.size * nslots].cast("I")
+        p += UINT.size * nslots
+        self._entries = p + UINT.size
+        self._end = self._entries + UINT.unpack_from(buf, p)[0]
+        self._tries = None
+
+    def get(self, kana, default=None):
+        (buf, slots, mask) = (self._buf, self._slots, self._mask)
+        key = kana.encode("utf-8")
+        i = zlib.crc32(key) & mask
+        p = slots[i]
+        while p:
+            q = p + 2 + buf[p]
+            if buf[p + 2:q] == key:
+                return buf[q:q + buf[p + 1]].decode("utf-8")
+            i = (i + 1) & mask
+            p = slots[i]
+        return default
+
+    def __getitem__(self, kana):
+        result = self.get(kana)
+        if result is None: raise KeyError(kana)
+        return result
+
+    def __contains__(self, kana):
+        return self.get(kana) is not None
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        (buf, p) = (self._buf, self._entries)
+        while p < self._end:
+            yield buf[p + 2:p + 2 + buf[p]].decode("utf-8")
+            p += 2 + buf[p] + buf[p + 1]
+
+    def tries(self):
+        """Return the forward and backward prefix tries of names."""
+        if self._tries is None:
+            self._tries = marshal.loads(self._buf[self._end:])
+        return self._tries
+
+
+def _openindex(paths):
+    """Return NameIndex of CSV files `paths`, rebuilding it if stale."""
+    stamps = _stamps(paths)
+    index = _indexpath(paths)
+    if index:
+        try:
+            with open(index, "rb") as in_:
+                buf = mmap.mmap(in_.fileno(), 0, access=mmap.ACCESS_READ)
+            result = NameIndex(buf)
+            if result.stamps == stamps: return result
+        except (OSError, EOFError, ValueError, TypeError, struct.error):
+            pass
+    buf = _buildindex(paths, stamps)
+    if index:
+        temp = "{}.{}".format(index, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(index), exist_ok=True)
+            with open(temp, "wb") as out:
+                out.write(buf)
+            os.replace(temp, index)
+            with open(index, "rb") as in_:
+                buf = mmap.mmap(in_.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            pass
+    return NameIndex(buf)
+
+
+def loadnames(path=NAMESFILE, *paths):
+    """Load a names dictionary from CSV files.
+
+    path        (str) CSV file of 'kana,romaji' lines [default: names.csv]
+    paths       (str) CSV files stacked over `path`; names in later files
+                take precedence
 
+    Returns a read-only mapping over a precompiled index in __pycache__
+    next to the last file, which is memory-mapped so as to be shared
+    among processes, and rebuilt when the size or the modification time
+    of any file changes.  Names which follow a comment line with
+    'family' or 'given' are taken as family or given names respectively
+    by roma_fullname(); others as either.
+    """
+    return _openindex([os.path.abspath(p) for p in (path,) + paths])
+
+
+def set_names(*paths):
+    """Stack user dictionaries over names.csv for name=True.
+
+    paths       (str) CSV files of 'kana,romaji' lines; names in later
+                files take precedence
+
+    set_names() with no arguments restores names.csv alone.  OSError is
+    raised if any of `paths` cannot be read.
+
+    Test:
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as temp:
+    ...     path = os.path.join(temp, "users.csv")
+    ...     with open(path, "w", encoding="utf-8") as out:
+    ...         _ = out.write("やまだ,Yamadah\\n")
+    ...     set_names(path)
+    ...     assert roma("やまだ", name=True) == "YAMADAH"
+    ...     assert roma("たなか", name=True) == "TANAKA"
+    ...     set_names()
+    >>> assert roma("やまだ", name=True) == "YAMADA"
+    >>> try: set_names("no-such-names.csv")
+    ... except FileNotFoundError: pass
+    ... else: raise AssertionError("set_names() took a missing file")
+    >>> assert roma("やまだ", name=True) == "YAMADA"
+    """
+    global _namesfiles, _nameindex, _namesdue
+    paths = tuple(os.path.abspath(p) for p in paths)
+    _stamps(paths)  # raise OSError now rather than on conversion
+    with _nameslock:
+        # names() reads these without the lock; see there.
+        _namesdue = 0.0
+        _namesfiles = (NAMESFILE,) + paths
+        _nameindex = None
+    cache_clear()
+
+
+def names():
+    """Return the names dictionary, loading it on first use.
+
+    The dictionary is reloaded when any of its files is modified, which
+    is checked at most every NAMESCHECK seconds.
+    """
+    # Read without the lock: the index is published before the time of
+    # the next check, and None is never returned.
+    index = _nameindex
+    if index is not None and time.monotonic() < _namesdue: return index
+    return _reloadnames()
+
+
+def nametries():
+    """Return the forward and backward prefix tries of names."""
+    return names().tries()
 
-NAMES = dict()
-with open(os.path.join(os.path.dirname(__file__), "names.csv"), "r",
-        encoding="utf-8-sig") as in_:
-    for line in in_:
-        line = line.split("#", 1)[0].strip()
-        if not line: continue
-        kana, roma = [s.strip() for s in line.split(",", 1)]
-        NAMES[h2k(kana)] = _translate(roma.upper(), "Â Î Û Ê Ô", "A^ I^ U^ E^ O^")
+
+def _reloadnames():
+    global _nameindex, _namesdue
+    with _nameslock:
+        index = _nameindex
+        if index is None:
+            index = _openindex(_namesfiles)
+        else:
+            try:
+                if _stamps(_namesfiles) != index.stamps:
+                    index = _openindex(_namesfiles)
+            except OSError:
+                pass  # keep the current one while files are replaced
+        if index is not _nameindex:
+            if _nameindex is not None: cache_clear()
+            _nameindex = index
+        _namesdue = time.monotonic() + NAMESCHECK
+    return index
+
+
+def __getattr__(name):
+    if name == "NAMES": return names()
+    raise AttributeError("module {!r} has no attribute {!r}".format(
+            __name__, name))
+
+
+COMPOSITES = dict((mark, tuple(
+        (c + mark, lookup("LATIN CAPITAL LETTER {} WITH {}".format(c, acc)))
+        for c in VOWELS)) for (mark, acc) in ACCENTNAME.items())
+CASES = ("upper", "lower", "title")
 
 
 def makecomposite(s, longmark):
-    accname = ACCENTNAME[longmark]
-    charname = "LATIN CAPITAL LETTER {} WITH {}"
-    for c in VOWELS:
-        if c not in s: continue
-        s = s.replace(c + longmark, lookup(charname.format(c, accname)))
+    for (a, b) in COMPOSITES[longmark]:
+        if a in s: s = s.replace(a, b)
+    return s
+
+
+def _case(s, case="upper"):
+    """Return romaji `s` in `case`; see roma()."""
+    if case == "lower": return s.lower()
+    if case == "title":
+        return " ".join(w[:1].upper() + w[1:].lower() for w in s.split(" "))
     return s
 
 
@@ -174,15 +602,45 @@ def iso3602(s, name=False):
     >>> assert iso3602(u"ジェラシー") == u"ZIERASI^"
     >>> assert iso3602(u"マッチャ") == u"MATTYA"
     """
-    if name and s in NAMES: return NAMES[s]
-    s = _translate(s, "ヰ ヱ ヲ ヂ ヅ ウ゛ ヴ", "イ エ オ ジ ズ ヴ ブ")
-    s = _translate(s, "ァ ィ ゥ ェ ォ", "XA XI XU XE XO")
-    s = _translate(s, "ン", "N'")
-    ss = list(s)
-    bc = list(KR.keys())
+    if _memo:
+        if name: names()  # drop memoized results if names are reloaded
+        return _memo("iso", s, bool(name))
+    return _iso3602(s, name)
+
+
+_isonames = (None, dict())  # (index, names decoded from it)
+
+
+def _isoname(s):
+    """Return romaji of name `s` in the dictionary, or None."""
+    global _isonames
+    index = names()
+    (of, decoded) = _isonames
+    if of is not index:
+        (of, decoded) = _isonames = (index, dict())
+    result = decoded.get(s)
+    if result is None:
+        result = index.get(s)
+        if result is not None: decoded[s] = result
+    return result
+
+
+def _iso3602(s, name=False):
+    if name:
+        romaji = _isoname(s)
+        if romaji is not None: return romaji
+    return _isofold(_isokana(s))
+
+
+N_APOS = re.compile(r"N'([^AIUEOY])")
+LONGRUNS = tuple((re.compile(c + "{2,}"), c + "^") for c in VOWELS)
+
+
+def _isokana(s):
+    ss = list(_isoletters(s))
     sokuon = False
     for p, c in enumerate(ss):
-        if c in bc:
+        if c in KR:
             ss[p] = KR[c]
             if sokuon:
                 ss[p] = ss[p][0] + ss[p]
@@ -196,18 +654,26 @@ def iso3602(s, name=False):
             ss[p] = ""
         elif c == "ー":
             ss[p] = "^"
-    s = "".join(ss)
-    s = s.replace("X", "")
-    s = re.sub(r"N'([^AIUEOY])", r"N\1", s)
+    return "".join(ss).replace("X", "")
+
+
+def _isoletters(s):
+    s = _translate(s, "ヰ ヱ ヲ ヂ ヅ ウ゛ ヴ", "イ エ オ ジ ズ ヴ ブ")
+    s = _translate(s, "ァ ィ ゥ ェ ォ", "XA XI XU XE XO")
+    return _translate(s, "ン", "N'")
+
+
+def _isofold(s):
+    s = N_APOS.sub(r"N\1", s)
     s = s.replace("OUU", "O^U")
-    for c in VOWELS:
-        s = re.sub(c + "{2,}", c + "^", s)
+    for (pattern, repl) in LONGRUNS:
+        s = pattern.sub(repl, s)
     s = s.replace("OU", "O^")
-    s = s.strip("'")
-    return s
+    return s.strip("'")
 
 
-def roma(s, system="ANSI", composite=False, name=False):
+def roma(s, system="ANSI", composite=False, name=False, normalize=False,
+         case="upper"):
     """Convert kana to its roman repr in various styles.
 
     s           (unicode) source text
@@ -216,6 +682,10 @@ def roma(s, system="ANSI", composite=False, name=False):
                 (dict) conversion specification
     composite   (bool) use chars with composite glyphs
     name        (bool) special conversion for names
+    normalize   (bool) normalize half-width katakana, voiced sound marks
+                and iteration marks first; see normkana()
+    case        (str) 'upper' | 'lower' | 'title'; 'title' capitalizes
+                the first letter of each word  [default: upper]
 
     Keys and values of conversion specification are as follows::
         long    (str) '^' | 'CIRCUMFLEX' | '~' | 'MACRON' |
@@ -318,19 +788,165 @@ def roma(s, system="ANSI", composite=False, name=False):
     >>> assert roma("カード", "MOFA") == "KADO"
     >>> assert roma("ジェラシー", "MOFA") == "JIERASHII"
     >>> assert roma("まっちゃ", "MOFA") == "MATCHA"
+    >>> assert roma("ｲｽｽﾞ", normalize=True) == "ISUZU"
+    >>> assert roma("いすゞ", normalize=True) == "ISUZU"
+    >>> assert roma("さとう", "ISO", True, case="title") == "Satô"
+    >>> assert roma("しんいち", "HEPBURN", case="lower") == "shin-ichi"
+    """
+    if normalize: s = normkana(s)
+    if _memo:
+        if name: names()  # drop memoized results if names are reloaded
+        return _memo("roma", h2k(s), speckey(system),
+                     bool(composite), bool(name), case)
+    return _romanizer(system, composite, case)(s, name=name)
+
+
+def roma_text(s, system="ANSI", composite=False, name=False,
+              normalize=False, case="upper"):
+    """Convert runs of kana in text to their roman repr.
+
+    s           (unicode) source text
+    system      (str|dict) see roma()
+    composite   (bool) use chars with composite glyphs
+    name        (bool) special conversion for names
+    normalize   (bool) see roma()
+    case        (str) see roma()
+
+    Kanji, ASCII, digits, punctuation, whitespace and any other chars
+    are copied as they are, and each run of kana is converted as a word
+    by roma().
+
+    Test:
+    >>> assert roma_text("ローマじ へんかん は 面倒だ。") == (
+    ...         "RO~MAJI HENKAN HA 面倒DA。")
+    >>> assert roma_text("第3かい (ISO)", "ISO") == "第3KAI (ISO)"
+    >>> assert roma_text("ーあ") == "ーA"
+    >>> assert roma_text("ﾀﾜｰへ", normalize=True) == "TAWA~HE"
     """
+    if normalize: s = normkana(s)
+    if _memo:
+        return KANARUN.sub(lambda m: roma(m.group(), system, composite, name,
+                                          case=case), s)
+    return _romanizer(system, composite, case).text(s, name=name)
+
+
+def roma_all(s, systems=("ANSI", "ISO", "HEPBURN", "MOFA"),
+             composite=False, name=False, case="upper"):
+    """Convert kana to its roman repr in several systems at once.
+
+    s           (unicode) source text
+    systems     (list) systems (str|dict) to convert into; see roma()
+    composite   (bool) use chars with composite glyphs
+    name        (bool) special conversion for names
+    case        (str) see roma()
+
+    Returns a list of romaji in the order of `systems`, identical to
+    those by roma() for each system.  The source is converted to
+    katakana and parsed into syllables once for all systems which share
+    the pre-processing, and only the final forms are made for each.
+
+    Test:
+    >>> assert roma_all("しんばし") == [
+    ...         "SHINBASHI", "SINBASI", "SHIMBASHI", "SHIMBASHI"]
+    >>> assert roma_all("カード", ["HEPBURN", "ROAD", "ISO"], True) == [
+    ...         "KAADO", "KADO", "KÂDO"]
+    >>> assert roma_all("ゔぃゔぁるでぃ", ["MOFA", "ANSI"]) == [
+    ...         roma("ゔぃゔぁるでぃ", "MOFA"), roma("ゔぃゔぁるでぃ")]
+    """
+    if _memo:
+        return [roma(s, system, composite, name, case=case)
+                for system in systems]
+    s = h2k(s)
+    parsed = dict()
+    result = []
+    for system in systems:
+        r = _romanizer(system, composite, case)
+        if name:
+            romaji = r._name(s)
+            if romaji is not None:
+                result.append(romaji)
+                continue
+        if r._prekey not in parsed:
+            parsed[r._prekey] = r._parse(s)
+        units = parsed[r._prekey]
+        result.append(r._fallback(s, name) if units is None
+                      else r._render(units))
+    return result
+
+
+def roma_fullname(s, system="ANSI", composite=False, case="upper"):
+    """Convert a full name in kana to its roman repr, family name first.
+
+    s           (unicode) source text
+    system      (str|dict) see roma()
+    composite   (bool) use chars with composite glyphs
+    case        (str) see roma()
+
+    Unless separated by whitespace, the family and given names are
+    found by segmentname(), and each of them is converted by roma()
+    with name=True.
+
+    Test:
+    >>> assert roma_fullname("やまだたろう") == "YAMADA TARO~"
+    >>> assert roma_fullname("さとうはなこ", "MOFA") == "SATO HANAKO"
+    >>> assert roma_fullname("さとうはなこ", "ISO", True, "title") == (
+    ...         "Satô Hanako")
+    """
+    return _romanizer(system, composite, case).fullname(s)
+
+
+def segmentname(s):
+    """Split a full name in katakana into family and given names.
+
+    s           (unicode) full name in katakana without whitespace
+
+    Returns a list of one or two names.  Prefixes in the names
+    dictionary as family names and suffixes as given names are found
+    by walking the prefix tries once from both ends; the longest family
+    name which leaves a given name is taken.  Failing that, the longest
+    known family name or given name is split off.  A full name which is
+    itself in the dictionary is not split.
+
+    Test:
+    >>> assert segmentname("ヤマダタロウ") == ["ヤマダ", "タロウ"]
+    >>> assert segmentname("ヤマダ") == ["ヤマダ"]
+    >>> assert segmentname("ヤマダポチ") == ["ヤマダ", "ポチ"]
+    >>> assert segmentname("ヲヲヲ") == ["ヲヲヲ"]
+    """
+    if s in names(): return [s]
+    (forward, backward) = nametries()
+    end = len(s)
+    family = [n for (n, flags) in _walk(forward, s)
+              if flags & FAMILY and n < end]
+    given = set(end - n for (n, flags) in _walk(backward, reversed(s))
+                if flags & GIVEN and n < end)
+    p = (max((n for n in family if n in given), default=0)
+         or max(family, default=0) or min(given, default=0))
+    return [s[:p], s[p:]] if p else [s]
+
+
+def _roma(s, system="ANSI", composite=False, name=False, kunrei2=False):
+    # Reference pipeline of roma(); Romanizer falls back on this for
+    # irregular input which its compiled table does not cover.
     s = h2k(s)
     if isinstance(system, str):
         system = (system or "ANSI").upper()
         if system == "ISO":
-            s = iso3602(s, name=name)
+            s = _iso3602(s, name=name)
             if composite: s = makecomposite(s, "^")
             return s
-        if system == "KUNREI2":
-            s = _translate(s,
-                    "ヂ ヅ ヂャ ヂュ ヂョ ヲ",
-                    "DI DU DYA DYU DYO WO")
+        kunrei2 = (system == "KUNREI2")
         system = RECIPE[system]
+    s = _preroma(s, system, kunrei2)
+    s = _iso3602(s, name=name)
+    return _postroma(s, system, composite)
+
+
+def _preroma(s, system, kunrei2=False):
+    if kunrei2:
+        s = _translate(s,
+                "ヂ ヅ ヂャ ヂュ ヂョ ヲ",
+                "DI DU DYA DYU DYO WO")
     s = _translate(s, "クヮ グヮ", "KWA GWA")
     if system["extend"]:
         s = _translate(s,
@@ -340,14 +956,35 @@ def roma(s, system="ANSI", composite=False, name=False):
                 ("YE WI WE WO VA VI VE VO VYU VU "
                  "ShI ShE ZhI JE ThI ThU CHE DI DU JE "
                  "TSA TsI TSE TSO FA FI FE FO"))
-    s = iso3602(s, name=name)
+    return s
+
+
+M4N = re.compile(r"N([BMP])")
+
+
+def _postroma(s, system, composite=False):
     if system["m4n"]:
-        s = re.sub(r"N([BMP])", r"M\1", s)
+        s = _m4n(s)
     s = _translate(s, "HU SI ZI TI TU SY ZY TY Sh Zh Th sI",
                       "FU SHI JI CHI TSU SH J CH S Z T SI")
     lng = system["long"].upper()
     if lng == "MACRON": lng = "~"
     elif lng == "CIRCUMFLEX": lng = "^"
+    s = _longvowel(s, lng)
+    if composite and lng in COMPOSITES:
+        s = makecomposite(s, lng)
+    if lng == "^":
+        s = s.replace("TCH", "CCH")
+    if system["sep"] != "'":
+        s = s.replace("'", system["sep"])
+    return s
+
+
+def _m4n(s):
+    return M4N.sub(r"M\1", s)
+
+
+def _longvowel(s, lng):
     if lng == "+":
         s = _translate(s, "A^ I^ U^ E^ O^", "AA II UU EE OO")
     elif lng == "H":
@@ -358,15 +995,413 @@ def roma(s, system="ANSI", composite=False, name=False):
         s = s.replace("^", "~")
     elif lng != "^":
         raise ValueError("invalid long vowel symbol '{}'".format(lng))
-    if composite and lng and lng != "+":
-        s = makecomposite(s, lng)
-    if lng == "^":
-        s = s.replace("TCH", "CCH")
-    if system["sep"] != "'":
-        s = s.replace("'", system["sep"])
     return s
 
 
+SYLLABLE = re.compile(r"([BCDFGHJKLMNPQRSTVWYZhs]*)([AIUEO^]+)")
+NASAL, SOKUON, IRREGULAR = "ン", "ッ", False
+NASALS = ("\0", "\1", "\2")  # placeholders of N, N with sep, N before BMP
+
+
+class Romanizer:
+
+    """Kana romanizer compiled for a particular system.
+
+    system      (str) 'ANSI' | 'ISO' | 'HEPBURN' | 'KUNREI2' |
+                      'ROAD' | 'RAIL' | 'MOFA'  [default: ANSI]
+                (dict) conversion specification; see roma()
+    composite   (bool) use chars with composite glyphs
+    case        (str) 'upper' | 'lower' | 'title'; see roma()
+
+    The specification is compiled once into a longest-match table over
+    kana, and each word is converted in a single left-to-right pass.
+    The final forms of syllables, with composite chars and in `case`,
+    are cached, so that they cost no more than plain ones.
+    The result is identical to roma(); words which the table does not
+    cover, e.g. those with non-kana letters, are passed to the plain
+    conversion pipeline.
+
+    Test:
+    >>> r = Romanizer("HEPBURN")
+    >>> assert r("しんばし") == "SHIMBASHI"
+    >>> assert r("さんあい") == "SAN-AI"
+    >>> assert r("まっちゃ") == "MATCHA"
+    >>> assert r("カード") == "KAADO"
+    >>> assert r("ROMA") == "ROMA"
+    >>> assert Romanizer("KUNREI2")("まっちゃ") == "MACCHA"
+    >>> assert Romanizer("ISO", composite=True)("カード") == "KÂDO"
+    >>> assert Romanizer("RAIL", True, "title")("さとう") == "Satō"
+    """
+
+    def __init__(self, system="ANSI", composite=False, case="upper"):
+        if case not in CASES:
+            raise ValueError("valid cases are: " + ",".join(CASES))
+        self.system = system
+        self.composite = composite
+        self.case = case
+        self._title = (case == "title")
+        if isinstance(system, str):
+            system = (system or "ANSI").upper()
+            self.iso = (system == "ISO")
+            kunrei2 = (system == "KUNREI2")
+            spec = RECIPE[system]
+        else:
+            self.iso = kunrei2 = False
+            spec = system
+        # A frozen copy, so that changes to RECIPE do not reach the tables.
+        spec = self._spec = MappingProxyType(dict(spec))
+        self._kunrei2 = kunrei2
+        if self.iso:
+            self._pre = lambda s: s
+            post = ((lambda s: makecomposite(s, "^")) if composite
+                    else (lambda s: s))
+        else:
+            self._pre = lambda s: _preroma(s, spec, kunrei2)
+            post = lambda s: _postroma(s, spec, composite)
+        self._post = post if case == "upper" else (lambda s: post(s).lower())
+        self._prekey = True if self.iso else (bool(spec["extend"]), kunrei2)
+        self._nsep = "N" + ("'" if self.iso else spec["sep"])
+        self._nbmp = "M" if spec["m4n"] and not self.iso else "N"
+        self._names = dict()
+        self._namesof = None
+        with _noprofile():  # stats are of conversions, not of compiling
+            self._post("")  # raise errors on invalid specification here
+            self._units = dict(zip(NASALS, map(self._post, (
+                    "N", self._nsep, self._nbmp))))
+            self._table = self._compile()
+
+    def _form(self, kana):
+        """Return (consonant, vowel) which `kana` yields in isolation."""
+        m = SYLLABLE.fullmatch(_isokana(self._pre(kana)))
+        return m.groups() if m else IRREGULAR
+
+    def _compile(self):
+        singles = set(KR) | set("ァィゥェォャュョヮヴー")
+        modifiers = "ァィゥェォャュョヮ゛゜"
+        keys = dict((c, self._form(c)) for c in singles)
+        for c in singles - set("ャュョー"):
+            for m in modifiers:
+                form = self._form(c + m)
+                if form != self._join(keys[c], keys.get(m, IRREGULAR)):
+                    keys[c + m] = form
+        for (k, form) in list(keys.items()):
+            if form and form[0] and form[0][0] not in VOWELS:
+                gemination = self._form(SOKUON + k)
+                if gemination == (form[0][0] + form[0], form[1]):
+                    keys[SOKUON + k] = gemination
+                    continue
+            keys[SOKUON + k] = IRREGULAR
+        keys[NASAL] = NASAL
+        keys[SOKUON] = SOKUON
+        table = dict()
+        for k in sorted(keys, key=len, reverse=True):
+            table.setdefault(k[0], []).append((k, keys[k]))
+        return table
+
+    @staticmethod
+    def _join(a, b):
+        if not a or not b or b[0]: return None
+        return (a[0], a[1] + b[1])
+
+    def _unit(self, unit):
+        """Return the final form of a syllable followed by long vowels."""
+        result = self._units.get(unit)
+        if result is None:
+            result = self._post(_isofold(unit))
+            if len(unit) < 8: self._units[unit] = result
+        return result
+
+    @staticmethod
+    def _nasal(skip, follower):
+        if skip or follower in "AIUEOY": return NASALS[1]
+        if follower in "BMP": return NASALS[2]
+        return NASALS[0]
+
+    def _name(self, s):
+        """Return romaji of name `s` in the dictionary, or None."""
+        index = names()
+        if index is not self._namesof:
+            (self._names, self._namesof) = (dict(), index)
+        if s in self._names: return self._names[s]
+        romaji = index.get(s)
+        if romaji is None: return None
+        result = None
+        if self._pre(s) == s:
+            result = self._post(romaji)
+            if self._title: result = _case(result, "title")
+        self._names[s] = result
+        return result
+
+    def __call__(self, s, name=False):
+        """Romanize a word.
+
+        s           (unicode) source text
+        name        (bool) special conversion for names
+        """
+        s = h2k(s)
+        if name:
+            result = self._name(s)
+            if result is not None: return result
+        parsed = self._parse(s)
+        if parsed is None: return self._fallback(s, name)
+        return self._render(parsed)
+
+    def _fallback(self, s, name=False):
+        return _case(_roma(s, "ISO" if self.iso else self._spec,
+                           self.composite, name, self._kunrei2), self.case)
+
+    def _parse(self, s):
+        """Return units and nasals of katakana `s`, or None if irregular.
+
+        A unit is a syllable followed by long vowels, and a nasal is one
+        of NASALS for N, N with sep, and N before B/M/P.  The result
+        depends only on the table, so that Romanizers with the same
+        _pre() can share it.
+        """
+        table = self._table
+        result = []
+        unit = ""
+        nasal = None  # None or True/False for pending 'N' which skips sep
+        p, end = 0, len(s)
+        while p < end:
+            for (k, token) in table.get(s[p], ()):
+                if s.startswith(k, p): break
+            else:
+                return None
+            if token is IRREGULAR: return None
+            p += len(k)
+            if token is NASAL:
+                if unit:
+                    result.append(unit)
+                    unit = ""
+                if nasal is None:
+                    nasal = False
+                else:
+                    result.append(self._nasal(nasal, "N"))
+                    nasal = not nasal
+                continue
+            if token is SOKUON:
+                if p < end: return None
+                continue
+            head, vowel = token
+            if nasal is not None:
+                result.append(self._nasal(nasal, (head or vowel)[0]))
+                nasal = None
+            if head:
+                if unit: result.append(unit)
+                unit = head + vowel
+            else:
+                unit += vowel
+        if unit: result.append(unit)
+        if nasal is not None: result.append(NASALS[0])
+        return result
+
+    def _render(self, parsed):
+        """Return romaji of the result of _parse()."""
+        units = self._units
+        try:
+            result = "".join(map(units.__getitem__, parsed))
+        except KeyError:
+            result = "".join([units.get(x) or self._unit(x) for x in parsed])
+        if self._title: return result[:1].upper() + result[1:]
+        return result
+
+    def text(self, s, name=False):
+        """Romanize runs of kana in text, leaving other chars as they are.
+
+        s           (unicode) source text
+        name        (bool) special conversion for names
+
+        Test:
+        >>> r = Romanizer("HEPBURN")
+        >>> assert r.text("東京タワーへ 行く。") == "東京TAWAAHE 行KU。"
+        >>> assert r.text("ABC  やまだ 123") == "ABC  YAMADA 123"
+        """
+        return KANARUN.sub(lambda m: self(m.group(), name), s)
+
+    def fullname(self, s):
+        """Romanize a full name, family name first.
+
+        s           (unicode) source text; family and given names may be
+                    separated by whitespace
+
+        Test:
+        >>> r = Romanizer("HEPBURN")
+        >>> assert r.fullname("やまだたろう") == "YAMADA TAROO"
+        >>> assert r.fullname("あいかわ けんいち") == "AIKAWA KEN-ICHI"
+        """
+        return " ".join(self(part, name=True) for part in
+                        (s.split() if len(s.split()) > 1 else
+                         segmentname(h2k(s.strip()))))
+
+
+SPECKEYS = ("long", "sep", "m4n", "extend")
+
+
+@functools.lru_cache(maxsize=64)
+def _compiled(system, composite, case="upper"):
+    if not isinstance(system, str):
+        system = dict(zip(SPECKEYS, system))
+    return Romanizer(system, composite, case)
+
+
+def speckey(system):
+    """Return a hashable key which identifies `system` for roma()."""
+    if isinstance(system, str):
+        return (system or "ANSI").upper()
+    return tuple(system[k] for k in SPECKEYS)
+
+
+def _romanizer(system, composite=False, case="upper"):
+    """Return a cached Romanizer for `system`."""
+    return _compiled(speckey(system), bool(composite), case)
+
+
+YOON = "ャュョ"
+WORDS = re.compile(r"(\S*)(\s*)")
+
+
+class Transliterator:
+
+    """Incremental romanizer of unbounded text.
+
+    system      (str|dict) see roma()
+    composite   (bool) use chars with composite glyphs
+
+    Text fed in chunks of any size is converted as far as the result
+    cannot depend on what follows, and the rest is held back until more
+    text or flush() comes; the output concatenated is identical to
+    roma() of the input concatenated.  Text is settled at whitespace
+    unless a yoon after reaches over it, or, while a word is longer than
+    MAXTAIL, before a syllable with a consonant.  A sokuon which has no
+    kana after it in its word is carried over to the next kana.
+
+    Some text cannot be settled until its end: text which starts with a
+    yoon, as roma() moves it to the very end, and a word without any
+    syllable with a consonant, e.g. a long run of vowels.  Up to MAXHELD
+    chars are held back; feed() raises ValueError instead of holding
+    more, leaving the chunk unconsumed, so that flush() may be called
+    before the chunk is fed again as the start of new text.
+
+    Test:
+    >>> t = Transliterator("HEPBURN")
+    >>> out = [t.feed(s) for s in ("しんば", "し まっ", "ちゃ らー", "めん")]
+    >>> assert out + [t.flush()] == ["", "SHIMBASHI ", "MATCHA ", "", "RAAMEN"]
+    >>> assert t.feed("がっ こう") == "GA "
+    >>> assert t.flush() == "KKOO"
+    >>> assert roma("がっ こう", "HEPBURN") == "GA KKOO"
+    >>> assert t.feed("かっ abc ") + t.feed("def き") == "KA abc def "
+    >>> assert t.flush() == "KKI"
+    >>> assert t.feed("カ 'キ' ク") + t.flush() == "KA -KI- KU"
+    >>> t.MAXHELD = 6
+    >>> assert t.feed("ゃあい") == ""
+    >>> t.feed("あいうえ か")
+    Traceback (most recent call last):
+    ...
+    ValueError: more than 6 chars held back; flush() first
+    >>> assert t.flush() == roma("ゃあい", "HEPBURN")
+    >>> assert t.feed("あいうえ か") == "AIUE "
+    """
+
+    MAXTAIL = 4096
+    MAXHELD = 1 << 20
+
+    def __init__(self, system="ANSI", composite=False):
+        self.system = system
+        self.composite = composite
+        self._romanizer = r = _romanizer(system, composite)
+        with _noprofile():
+            self._heads = frozenset(c for c in KR if r._form(c)[0])
+        self._plain = frozenset(KR) - frozenset("〓ヂヅヲ")
+        self._tail = ""
+        self._whole = None
+        self._begun = False  # whether any text has been settled
+        self._carry = False  # whether a sokuon is pending over it
+
+    def feed(self, s):
+        """Romanize a chunk of text, and return the settled part.
+
+        s           (unicode) chunk of source text
+        """
+        s = self._tail + h2k(s)
+        whole = self._whole
+        if whole is None and s:
+            # roma() moves a yoon at the very beginning to the very end.
+            whole = s[0] in YOON
+        if whole:
+            self._hold(s, whole, False, False)
+            return ""
+        result = []
+        (start, end, begun) = (0, len(s), self._begun)
+        carry = pending = self._carry
+        for m in WORDS.finditer(s):
+            (word, space) = m.groups()
+            if not space: break
+            pending = self._sokuon(word, pending)
+            if m.end() < end and s[m.end()] not in YOON:
+                if word.endswith("ン"):  # sep may be left before space
+                    result.append(self._settle(s[start:m.end()], begun,
+                                               carry))
+                else:
+                    result.append(self._settle(s[start:m.start(2)], begun,
+                                               carry))
+                    result.append(space)
+                (start, begun, carry) = (m.end(), True, pending)
+        if end - start > self.MAXTAIL:
+            p = self._split(s, start)
+            if p:  # after kana, which takes a pending sokuon
+                result.append(self._settle(s[start:p], begun, carry))
+                (start, begun, carry) = (p, True, False)
+        self._hold(s[start:], whole, begun, carry)
+        return "".join(result)
+
+    def _hold(self, s, whole, begun, carry):
+        """Hold back text `s`, unless it is longer than MAXHELD."""
+        if len(s) > self.MAXHELD:
+            raise ValueError("more than {} chars held back; "
+                             "flush() first".format(self.MAXHELD))
+        (self._tail, self._whole) = (s, whole)
+        (self._begun, self._carry) = (begun, carry)
+
+    def flush(self):
+        """Romanize the text held back, and start over with new text."""
+        (s, begun, carry) = (self._tail, self._begun, self._carry)
+        (self._tail, self._whole) = ("", None)
+        (self._begun, self._carry) = (False, False)
+        return self._settle(s, begun, carry, True)
+
+    def _settle(self, s, begun, carry=False, final=False):
+        """Romanize a part of text, which `begun` after its start.
+
+        A sokuon settled before with no kana after it yet is `carry`-ed
+        over to the part.  roma() strips apostrophes only at the ends of
+        the whole text, so they are kept at the other ends of parts
+        behind a sentinel.
+        """
+        if carry: s = SOKUON + s
+        if "'" not in s: return self._romanizer(s)
+        head = "\0" if begun else ""
+        tail = "" if final else "\0"
+        result = self._romanizer(head + s + tail)
+        return result[len(head):len(result) - len(tail)]
+
+    def _sokuon(self, word, pending):
+        """Return whether a sokuon is pending after `word`."""
+        p = word.rfind("ッ")
+        if p >= 0: (word, pending) = (word[p + 1:], True)
+        if pending and word:
+            pending = not any(c in KR
+                              for c in _isoletters(self._romanizer._pre(word)))
+        return pending
+
+    def _split(self, s, start):
+        """Return the last place after `start` to split a word, or 0."""
+        (heads, plain) = (self._heads, self._plain)
+        for p in range(len(s) - 1, start, -1):
+            if s[p] in heads and s[p - 1] in plain: return p
+        return 0
+
+
 # COMPATIBILITY
 romazi = iso3602
 romaji = roma
@@ -398,14 +1433,349 @@ def katakana(s, mofa=False, long_h=False):
     >>> assert katakana("AHA", long_h=True) == "アーア"
     >>> assert katakana("ÂA") == "アーア"
     """
-    s = _translate(s.upper(), "SHI TCH", "SI TTY")
-    if mofa:
-        s = _translate(s, "CHIE JIE TEI DEI DEYU FUA FUI FUE FUO",
-                          "CHE JE THI DHI DYU FA FI FE FO")
-    s = _translate(s.upper(), "CHI JI", "TI ZI")
-    b, y, lng = "", False, False
-    result = []
-    for c in s:
+    if _memo: return _memo("kana", s.upper(), bool(mofa), bool(long_h))
+    return _deromanizer(mofa, long_h)(s)
+
+
+def hiragana(s, mofa=False, long_h=False):
+    return k2h(katakana(s, mofa, long_h))
+
+
+def roma_column(values, system="ANSI", composite=False, name=False,
+                categorical=False):
+    """Convert a column of kana to their roman repr.
+
+    values      (iterable|pandas.Series|pyarrow.Array) source texts;
+                values other than str, e.g. None, are passed through
+    system      (str|dict) see roma()
+    composite   (bool) use chars with composite glyphs
+    name        (bool) special conversion for names
+    categorical (bool) return a categorical Series or a dictionary
+                array for pandas or pyarrow input
+
+    Each distinct value is converted only once and the results are
+    broadcast back; a list is returned for other iterables, whose
+    equal results are one and the same string.
+
+    Test:
+    >>> assert roma_column(["かんだ", "カンダ", None, "かんだ"]) == [
+    ...         "KANDA", "KANDA", None, "KANDA"]
+    >>> assert roma_column(iter(["かんだ", "しんばし"])) == [
+    ...         "KANDA", "SHINBASHI"]
+    """
+    convert = functools.partial(_romanizer(system, composite), name=name)
+    return _column(values, convert, categorical)
+
+
+def katakana_column(values, mofa=False, long_h=False, categorical=False):
+    """Convert a column of romaji to katakana.
+
+    values      (iterable|pandas.Series|pyarrow.Array) source texts
+    mofa        (bool) regard 'TIE' as 'CHE'
+    long_h      (bool) regard 'H' as long syllable mark
+    categorical (bool) see roma_column()
+
+    Test:
+    >>> assert katakana_column(("ROHMAJI", "ROHMAJI"), long_h=True) == [
+    ...         "ローマジ", "ローマジ"]
+    """
+    return _column(values, _deromanizer(mofa, long_h), categorical)
+
+
+def _column(values, convert, categorical=False):
+    pd = sys.modules.get("pandas")
+    if pd is not None and isinstance(values, pd.Series):
+        return _pandascolumn(pd, values, convert, categorical)
+    pa = sys.modules.get("pyarrow")
+    if pa is not None and isinstance(values, pa.ChunkedArray):
+        return pa.chunked_array(
+                [_arrowcolumn(pa, chunk, convert, categorical)
+                 for chunk in values.chunks])
+    if pa is not None and isinstance(values, pa.Array):
+        return _arrowcolumn(pa, values, convert, categorical)
+    if not isinstance(values, Sequence):
+        values = list(values)  # read iterators once for both passes
+    table = dict.fromkeys(values)
+    for k in table:
+        if isinstance(k, str): table[k] = convert(k)
+    return list(map(table.__getitem__, values))
+
+
+def _recode(uniques, convert):
+    """Return converted `uniques` without duplicates and codes to them."""
+    results = dict()
+    codes = [results.setdefault(convert(u) if isinstance(u, str) else u,
+                                len(results)) for u in uniques]
+    return (list(results), codes)
+
+
+def _pandascolumn(pd, values, convert, categorical):
+    import numpy as np
+    (codes, uniques) = pd.factorize(values)
+    (results, recodes) = _recode(uniques, convert)
+    recodes = np.array(recodes + [-1], dtype=codes.dtype)[codes]
+    if categorical:
+        column = pd.Categorical.from_codes(recodes, results)
+    else:
+        column = np.array(results + [None], dtype=object)[recodes]
+    return pd.Series(column, index=values.index, name=values.name)
+
+
+def _arrowcolumn(pa, values, convert, categorical):
+    encoded = values.dictionary_encode()
+    (results, recodes) = _recode(encoded.dictionary.to_pylist(), convert)
+    indices = pa.array(recodes, encoded.indices.type).take(encoded.indices)
+    if categorical:
+        return pa.DictionaryArray.from_arrays(indices, pa.array(results))
+    return pa.array(results).take(indices)
+
+
+def roma_many(words, system="ANSI", composite=False, name=False,
+              executor=None, chunksize=256):
+    """Convert kana words to their roman repr on a pool of threads.
+
+    words       (iterable) source texts
+    system      (str|dict) see roma()
+    composite   (bool) use chars with composite glyphs
+    name        (bool) special conversion for names
+    executor    (concurrent.futures.Executor) threads to run on; a
+                ThreadPoolExecutor of os.cpu_count() threads if None
+    chunksize   (int) number of words converted in a task
+
+    Yields results in the order of `words`, identical to roma() of each
+    word.  The conversion is compiled before the threads start, and they
+    only read its tables, a frozen copy of the specification and the
+    read-only RECIPE, KT, KR and RK, so that threads run in parallel on
+    free-threaded CPython.
+
+    Test:
+    >>> words = ["しんばし", "カード", "ROMA", "やまだ"] * 100
+    >>> assert list(roma_many(words, "HEPBURN", chunksize=7)) == [
+    ...         roma(w, "HEPBURN") for w in words]
+    >>> try: KR["カ"] = "GA"
+    ... except TypeError: pass
+    ... else: raise AssertionError("KR is writable")
+    >>> try: RECIPE["ANSI"]["long"] = "+"
+    ... except TypeError: pass
+    ... else: raise AssertionError("RECIPE is writable")
+    """
+    if _memo:
+        convert = lambda word: roma(word, system, composite, name)
+    else:
+        convert = functools.partial(_romanizer(system, composite), name=name)
+    if name: names()
+    return _many(convert, words, executor, chunksize)
+
+
+def katakana_many(words, mofa=False, long_h=False, executor=None,
+                  chunksize=256):
+    """Convert romaji words to katakana on a pool of threads.
+
+    words       (iterable) romaji words
+    mofa        (bool) regard 'TIE' as 'CHE'
+    long_h      (bool) regard 'H' after vowels as long syllable marks
+    executor    (concurrent.futures.Executor) see roma_many()
+    chunksize   (int) number of words converted in a task
+
+    Yields results in the order of `words`, identical to katakana().
+
+    Test:
+    >>> words = ["SHIMBASHI", "ROHMAJI", "kon'nyaku 1"] * 100
+    >>> assert list(katakana_many(words, long_h=True, chunksize=7)) == [
+    ...         katakana(w, long_h=True) for w in words]
+    """
+    if _memo:
+        convert = lambda word: katakana(word, mofa, long_h)
+    else:
+        convert = _deromanizer(mofa, long_h)
+    return _many(convert, words, executor, chunksize)
+
+
+def _many(convert, words, executor=None, chunksize=256):
+    """Yield `convert(word)` for each of `words`, using `executor`."""
+    if executor is None:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(os.cpu_count()) as executor:
+            yield from _many(convert, words, executor, chunksize)
+        return
+    from collections import deque
+    run = lambda chunk: [convert(word) for word in chunk]
+    words = iter(words)
+    chunks = iter(lambda: list(itertools.islice(words, chunksize)), [])
+    depth = 2 * (os.cpu_count() or 1)
+    pending = deque()
+    for chunk in chunks:
+        pending.append(executor.submit(run, chunk))
+        if len(pending) > depth:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
+
+
+SEARCHSYSTEMS = ("ISO", "ANSI", "MOFA", "KUNREI2")  # one for each _pre()
+SEARCHUNITS = dict(
+    CCHI="TTI", CCH="TTY", SHI="SI", SH="SY", CHI="TI", CH="TY",
+    JI="ZI", J="ZY", TSU="TU", FU="HU", MB="NB", MM="NM", MP="NP")
+SEARCHRULES = (
+    (re.compile(r"[^A-Z]+"), ""),  # marks, separators and accents
+    (re.compile("|".join(sorted(SEARCHUNITS, key=len, reverse=True))),
+     lambda m: SEARCHUNITS[m.group()]),
+    (re.compile(r"O[OU]*H(?![AIUEOY])|O[OU]+"), "O"),
+    (re.compile(r"([AIUEO])\1+"), r"\1"),
+    )
+
+
+def searchkey(s):
+    """Return the key to search for romaji in any system.
+
+    s           (unicode) romaji in any system, in any case, with or
+                without composite chars; kana is romanized in ISO
+
+    Long vowels (marks, doubled or omitted vowels, 'OU' and 'OH'),
+    separators, m for n and Hepburn or Kunrei consonants are collapsed,
+    so that the romaji of a word in most systems of RECIPE has the same
+    key.  Spellings which differ before romanization still give other
+    keys: non-native sounds, e.g. 'FAN' and 'HUAN' for 'ファン', and
+    ヂ, ヅ and ヲ in KUNREI2, e.g. 'AIDU' and 'AIZU' for 'アイヅ'; only
+    SearchIndex covers them.
+
+    Test:
+    >>> keys = ("SHINBASHI", "SIMBASI", "shimbashi", "SINBASI", "しんばし")
+    >>> assert set(map(searchkey, keys)) == {"SINBASI"}
+    >>> assert searchkey("TŌKYŌ") == searchkey("TOUKYOU") == "TOKYO"
+    >>> assert searchkey("MATCHA") == searchkey("MACCHA") == "MATTYA"
+    >>> assert searchkey("Ohta") == searchkey("O^TA") == "OTA"
+    >>> assert searchkey("AIDU") != searchkey("AIZU")
+    """
+    if KANARUN.search(s): s = roma(s, "ISO")
+    s = s.upper() if s.isascii() else unicodedata.normalize("NFD", s).upper()
+    for (pattern, repl) in SEARCHRULES:
+        s = pattern.sub(repl, s)
+    return s
+
+
+class SearchIndex(Mapping):
+
+    """Index of kana words to look up by romaji in any system.
+
+    words       (iterable) kana words
+
+    Each word is indexed by searchkey() of its romaji in SEARCHSYSTEMS,
+    which covers every system in RECIPE including non-native sounds,
+    e.g. 'FAN' and 'HUAN' for 'ファン', and ヂ, ヅ and ヲ in KUNREI2,
+    e.g. 'AIDU' and 'AIZU' for 'アイヅ'.  The index maps keys to lists
+    of words, and romaji in any spelling is looked up by its key.
+
+    Test:
+    >>> index = SearchIndex(["しんばし", "ファン", "シンバシ", "ふあん"])
+    >>> assert index["Shimbashi"] == index["SINBASI"] == ["しんばし", "シンバシ"]
+    >>> assert index["FAN"] == ["ファン"]
+    >>> assert index["HUAN"] == ["ファン", "ふあん"]
+    >>> assert SearchIndex(["あいづ"])["AIDU"] == ["あいづ"]
+    >>> assert "SHINBASI" in index and "SHINJUKU" not in index
+    """
+
+    def __init__(self, words=()):
+        self._index = dict()
+        self._words = set()
+        self.update(words)
+
+    def update(self, words):
+        """Add kana `words` to the index."""
+        index = self._index
+        for word in words:
+            if word in self._words: continue
+            self._words.add(word)
+            for key in set(map(searchkey, set(roma_all(word, SEARCHSYSTEMS)))):
+                index.setdefault(key, []).append(word)
+
+    def __getitem__(self, romaji):
+        return self._index[searchkey(romaji)]
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        return iter(self._index)
+
+
+WHITESPACE = "".join(c for c in map(chr, range(0x3001)) if c.isspace())
+ROMAN = "ABCDEFGHIJKLMNOPQRSTUVWXYZ'" + LONGVOWELS
+
+
+class Deromanizer:
+
+    """Romaji to katakana converter compiled for particular options.
+
+    mofa        (bool) regard 'TIE' as 'CHE'
+    long_h      (bool) regard 'H' after vowels as long syllable marks
+
+    The substitutions for digraphs are merged into a single pattern and
+    the syllable rules are compiled into a transition table, so that
+    each character costs one table lookup.  The result is identical to
+    katakana().
+
+    Test:
+    >>> d = Deromanizer(long_h=True)
+    >>> assert d("SHIMBASHI") == "シンバシ"
+    >>> assert d("ROHMAJI") == "ローマジ"
+    >>> assert d.buffer("  ROHMAJI  HENKAN\\nMENDOH DA.\\n") == \\
+    ...         "ローマジ ヘンカン\\nメンドー ダ.\\n"
+    """
+
+    def __init__(self, mofa=False, long_h=False):
+        self.mofa = bool(mofa)
+        self.long_h = bool(long_h)
+        pairs = [("SHI", "SI"), ("TCH", "TTY")]
+        if mofa:
+            pairs.extend(zip(
+                    "CHIE JIE TEI DEI DEYU FUA FUI FUE FUO".split(),
+                    "CHE JE THI DHI DYU FA FI FE FO".split()))
+        pairs.extend([("CHI", "TI"), ("JI", "ZI")])
+        subst = dict(pairs)
+        self._pairs = pairs
+        self._pattern = re.compile("|".join(k for (k, v) in pairs))
+        self._subst = lambda m: subst[m.group()]
+        self._states = [None, None]
+        self._ids = dict()
+        self._final = ["", ""]
+        self._rows = [None, None]   # transitions within a word
+        self._brows = [self._blank(self.LINE), self._blank(self.GAP)]
+        self._lock = threading.Lock()
+        self._start = self._state(("", False, False))
+        p = self._start
+        while p < len(self._states):
+            for c in ROMAN:
+                self._transit(p, c)
+            p += 1
+
+    # Pseudo states for buffer(), in which whitespace separates words.
+    LINE = 0    # no word yet on the line
+    GAP = 1     # whitespace after a word
+
+    def _blank(self, sid):
+        row = dict((c, ("", sid)) for c in WHITESPACE)
+        row["\n"] = ("\n", self.LINE)
+        return row
+
+    def _state(self, state):
+        sid = self._ids.get(state)
+        if sid is None:
+            sid = self._ids[state] = len(self._states)
+            final = "ン" if state[0] == "N" else state[0]
+            self._states.append(state)
+            self._final.append(final)
+            self._rows.append(dict())
+            row = dict((c, (final, self.GAP)) for c in WHITESPACE)
+            row["\n"] = (final + "\n", self.LINE)
+            self._brows.append(row)
+        return sid
+
+    def _step(self, state, c):
+        """Return output and new state of katakana() on char `c`."""
+        (b, y, started) = state
+        result = []
+        lng = False
         if c in LONGVOWELS:
             c = VOWELS[LONGVOWELS.index(c)]
             lng = True
@@ -420,11 +1790,11 @@ def katakana(s, mofa=False, long_h=False):
             else:
                 result.append(RK[b or "_"][vi])
             if lng: result.append("ー")
-            b, y, lng = "", False, False
-            continue
+            return "".join(result), ("", False, True)
         bc = b + c
         if b and c == "Y": y = True
-        elif long_h and b == "" and c == "H" and result: result.append("ー")
+        elif self.long_h and b == "" and c == "H" and started:
+            result.append("ー")
         elif b == "N" or (b == "M" and c in ("B", "P")):
             result.append("ン")
             b = "" if c == "'" else c
@@ -434,15 +1804,240 @@ def katakana(s, mofa=False, long_h=False):
         elif bc in ("CH", "TC"): b = "T"; y = True
         elif bc == "TS": b = "s"
         else: result.append(b); b = c
-    result.append("ン" if b == "N" else b)
-    return "".join(result)
+        return "".join(result), (b, y, started or bool(result))
 
+    def _transit(self, sid, c):
+        """Compile the transition from state `sid` on char `c`.
 
-def hiragana(s, mofa=False, long_h=False):
-    return k2h(katakana(s, mofa, long_h))
+        Tables only grow, under the lock, so that threads can read them
+        without locking.
+        """
+        with self._lock:
+            if c in self._rows[sid]: return self._rows[sid][c]
+            (out, state) = self._step(self._states[sid], c)
+            nxt = self._state(state)
+            if c not in WHITESPACE:
+                self._brows[sid][c] = (out, nxt)
+                if sid == self._start:
+                    self._brows[self.LINE][c] = (out, nxt)
+                    self._brows[self.GAP][c] = (" " + out, nxt)
+            self._rows[sid][c] = (out, nxt)
+            return (out, nxt)
+
+    def __call__(self, s):
+        """Convert a romaji word to katakana."""
+        s = self._pattern.sub(self._subst, s.upper())
+        rows, sid = self._rows, self._start
+        result = []
+        for c in s:
+            try:
+                (out, sid) = rows[sid][c]
+            except KeyError:
+                (out, sid) = self._transit(sid, c)
+            result.append(out)
+        result.append(self._final[sid])
+        return "".join(result)
+
+    def buffer(self, s):
+        """Convert words in a text buffer to katakana.
+
+        Words in each line are converted and joined by a space, as the
+        jaroma command does; line feeds are preserved.
+        """
+        s = self._pattern.sub(self._subst, s.upper())
+        rows, sid = self._brows, self.LINE
+        result = []
+        for c in s:
+            try:
+                (out, sid) = rows[sid][c]
+            except KeyError:
+                if self._states[sid] is None:
+                    self._transit(self._start, c)
+                else:
+                    self._transit(sid, c)
+                (out, sid) = rows[sid][c]
+            result.append(out)
+        result.append(self._final[sid])
+        return "".join(result)
+
+
+@functools.lru_cache(maxsize=None)
+def _deromanizer(mofa=False, long_h=False):
+    return Deromanizer(mofa, long_h)
+
+
+class KanaInput:
+
+    """Incremental romaji to kana converter for per-keystroke input.
+
+    mofa        (bool) regard 'TIE' as 'CHE'
+    long_h      (bool) regard 'H' after vowels as long syllable marks
+    hiragana    (bool) output in hiragana instead of katakana
+
+    Each keystroke is fed to the transition table of Deromanizer, with
+    up to a few chars held until the digraph substitutions are decided,
+    and is undone by restoring the state saved before it; both cost O(1)
+    amortized.  `kana` is always identical to katakana() (or hiragana())
+    of `text`; `committed` is its part which no more keystrokes change,
+    and `pending` is the romaji typed after that.
+
+    Test:
+    >>> ime = KanaInput()
+    >>> ime.push("shinbas")
+    >>> assert (ime.committed, ime.pending, ime.kana) == ("シンバ", "s", "シンバS")
+    >>> ime.push("hi")
+    >>> assert (ime.committed, ime.pending, ime.kana) == ("シンバシ", "", "シンバシ")
+    >>> assert ime.backspace() == "i" and ime.pending == "sh"
+    >>> ime = KanaInput(hiragana=True)
+    >>> ime.push("kon'nyaku")
+    >>> assert (ime.text, ime.kana) == ("kon'nyaku", "こんにゃく")
+    """
+
+    def __init__(self, mofa=False, long_h=False, hiragana=False):
+        self._derom = _deromanizer(mofa, long_h)
+        self._conv = k2h if hiragana else (lambda s: s)
+        self.clear()
+
+    def clear(self):
+        """Discard all input."""
+        self._text = []
+        self._out = []      # pieces of output
+        self._sid = self._derom._start
+        self._held = ""     # chars held for the digraph substitutions
+        self._rest = 0      # number of pieces of committed output
+        self._restp = 0     # number of chars of text before pending
+        self._undo = []
+
+    def push(self, s):
+        """Type chars `s`."""
+        for c in s:
+            self._undo.append((self._sid, self._held, len(self._out),
+                               self._rest, self._restp))
+            self._text.append(c)
+            (fed, self._held) = self._subst(self._held + c.upper())
+            self._sid = self._feed(self._sid, fed, self._out)
+            state = self._derom._states[self._sid]
+            if not self._held and not state[0] and not state[1]:
+                (self._rest, self._restp) = (len(self._out), len(self._text))
+
+    def backspace(self):
+        """Delete the last char typed, and return it or '' if none."""
+        if not self._text: return ""
+        (self._sid, self._held, n, self._rest, self._restp
+                ) = self._undo.pop()
+        del self._out[n:]
+        return self._text.pop()
+
+    def _subst(self, s, final=False):
+        """Return digraph-substituted chars decided in `s`, and the rest.
+
+        The substitutions are made as Deromanizer does by re.sub(), but
+        chars which may begin a digraph are held unless `final`.
+        """
+        result = []
+        while s:
+            for (k, v) in self._derom._pairs:
+                if s.startswith(k):
+                    result.append(v)
+                    s = s[len(k):]
+                    break
+                if not final and k.startswith(s): return ("".join(result), s)
+            else:
+                result.append(s[0])
+                s = s[1:]
+        return ("".join(result), "")
+
+    def _feed(self, sid, s, out):
+        rows = self._derom._rows
+        for c in s:
+            try:
+                (piece, sid) = rows[sid][c]
+            except KeyError:
+                (piece, sid) = self._derom._transit(sid, c)
+            if piece: out.append(self._conv(piece))
+        return sid
+
+    @property
+    def text(self):
+        """Romaji typed so far."""
+        return "".join(self._text)
+
+    @property
+    def committed(self):
+        """Kana which no more keystrokes change."""
+        return "".join(self._out[:self._rest])
+
+    @property
+    def pending(self):
+        """Romaji typed after the committed kana."""
+        return "".join(self._text[self._restp:])
+
+    @property
+    def kana(self):
+        """Kana of the whole input, as katakana() or hiragana()."""
+        out = self._out[:]
+        sid = self._feed(self._sid, self._subst(self._held, True)[0], out)
+        out.append(self._conv(self._derom._final[sid]))
+        return "".join(out)
+
+    def __str__(self):
+        return self.kana
+
+
+_memo = None
+CacheInfo = namedtuple("CacheInfo", "hits misses maxsize currsize")
+
+
+def _convert(kind, s, *options):
+    if kind == "roma":
+        (system, composite, name, case) = options
+        return _compiled(system, composite, case)(s, name=name)
+    if kind == "iso":
+        return _iso3602(s, *options)
+    return _deromanizer(*options)(s)
+
+
+def set_cache(maxsize=4096):
+    """Memoize results of roma(), iso3602() and katakana().
+
+    maxsize     (int) max number of results to keep; 0 to disable
+
+    Results are keyed on the normalized source text and the whole
+    conversion specification, and least recently used ones are
+    discarded.  The cache is safe to share among threads.
+
+    Test:
+    >>> set_cache(16)
+    >>> assert roma("かんだ") == roma("カンダ") == "KANDA"
+    >>> assert roma("かんだ", dict(long="", sep="", m4n=True, extend=False))
+    >>> assert katakana("kanda") == katakana("KANDA") == "カンダ"
+    >>> assert cache_info() == (2, 3, 16, 3)
+    >>> cache_clear()
+    >>> assert cache_info() == (0, 0, 16, 0)
+    >>> set_cache(0)
+    """
+    global _memo
+    if maxsize:
+        _memo = functools.lru_cache(maxsize=maxsize)(_convert)
+    else:
+        _memo = None
+
+
+def cache_info():
+    """Return (hits, misses, maxsize, currsize) of the memoization cache."""
+    if _memo: return CacheInfo(*_memo.cache_info())
+    return CacheInfo(0, 0, 0, 0)
+
+
+def cache_clear():
+    """Discard all memoized results and statistics."""
+    if _memo: _memo.cache_clear()
 
 
 def romaja(args):
+    set_cache(int(args["--cache"]))
+    set_stats(args["--stats"])
+    if args["--names"]: set_names(*args["--names"].split(os.pathsep))
     name = args["--name"]
     if args["--kunrei"]: system = "ISO"
     elif args["--kunrei2"]: system = "KUNREI2"
@@ -462,25 +2057,725 @@ def romaja(args):
         if system["long"].upper() == "NO": system["long"] = ""
         if system["sep"].upper() == "NO": system["sep"] = ""
     c = args["--composite"]
+    mixed = args["--mixed"]
+    fullname = args["--fullname"]
+    normalize = args["--normalize"]
+    case = args["--case"].lower()
+    if case not in CASES:
+        raise ValueError("valid cases are: " + ",".join(CASES))
+    if normalize and args["WORD"]:
+        args["WORD"] = [normkana(word) for word in args["WORD"]]
+    systems = None
+    if args["--systems"]:
+        systems = [x.strip().upper() for x in args["--systems"].split(",")]
+        if not all(x in RECIPE for x in systems):
+            raise ValueError("valid systems are: " + ",".join(RECIPE))
+    if args["WORD"] and systems:
+        convert = functools.partial(_romaja_block, composite=c, name=name,
+                mixed=mixed, fullname=fullname, systems=systems, case=case)
+        sys.stdout.write(convert(" ".join(args["WORD"]) + "\n"))
+        if args["--stats"]: _printstats(stats())
+        return
     if args["WORD"]:
-        print(" ".join(roma(word, system, c, name) for word in args["WORD"]))
+        if fullname:
+            print(roma_fullname(" ".join(args["WORD"]), system, c, case))
+        else:
+            convert = roma_text if mixed else roma
+            print(" ".join(convert(word, system, c, name, case=case)
+                           for word in args["WORD"]))
+        if args["--stats"]: _printstats(stats())
         return
-    for line in sys.stdin:
-        print(" ".join(roma(word, system, c, name) for word in line.split()))
+    if systems:
+        sep = "\t" if args["--format"].lower() == "text" else COLUMNSEP
+        _pipe(functools.partial(_romaja_block, composite=c, name=name,
+                                mixed=mixed, fullname=fullname,
+                                systems=systems, sep=sep,
+                                normalize=normalize, case=case),
+              args, suffix=["_" + x.lower() for x in systems])
+        return
+    _pipe(functools.partial(_romaja_block, system=system, composite=c,
+                            name=name, mixed=mixed, fullname=fullname,
+                            normalize=normalize, case=case),
+          args, suffix="_roma")
 
 
 def jaroma(args):
+    set_cache(int(args["--cache"]))
+    set_stats(args["--stats"])
     kana = hiragana if args["--hiragana"] else katakana
     mofa = args["--mofa"]
     long_h = args["--long-h"]
     if args["WORD"]:
         print(" ".join(kana(word, mofa, long_h) for word in args["WORD"]))
+        if args["--stats"]: _printstats(stats())
+        return
+    _pipe(functools.partial(_jaroma_block, hiragana=args["--hiragana"],
+                            mofa=mofa, long_h=long_h),
+          args, suffix="_kana")
+
+
+def _romaja_block(block, system="ANSI", composite=False, name=False,
+                  mixed=False, fullname=False, systems=None, sep="\t",
+                  normalize=False, case="upper"):
+    if normalize: block = normkana(block)
+    if systems and (mixed or fullname or _memo):
+        columns = [_romaja_block(block, x, composite, name, mixed, fullname,
+                                 case=case).split("\n")[:-1]
+                   for x in systems]
+        return "".join(sep.join(line) + "\n" for line in zip(*columns))
+    if systems:
+        result = []
+        for line in block.split("\n")[:-1]:
+            words = [roma_all(word, systems, composite, name, case)
+                     for word in line.split()]
+            columns = zip(*words) if words else [()] * len(systems)
+            result.append(sep.join(map(" ".join, columns)) + "\n")
+        return "".join(result)
+    if fullname:
+        convert = _romanizer(system, composite, case).fullname
+        return "".join(convert(line) + "\n"
+                       for line in block.split("\n")[:-1])
+    if mixed:
+        return roma_text(block, system, composite, name, case=case)
+    if _memo:
+        convert = lambda word: roma(word, system, composite, name, case=case)
+    else:
+        convert = functools.partial(_romanizer(system, composite, case),
+                                    name=name)
+    return "".join(" ".join(map(convert, line.split())) + "\n"
+                   for line in block.split("\n")[:-1])
+
+
+def _jaroma_block(block, hiragana=False, mofa=False, long_h=False):
+    if _memo:
+        block = "".join(" ".join(katakana(word, mofa, long_h)
+                                 for word in line.split()) + "\n"
+                        for line in block.split("\n")[:-1])
+    else:
+        block = _deromanizer(mofa, long_h).buffer(block)
+    return k2h(block) if hiragana else block
+
+
+def _blocks(stream, size=1 << 20):
+    """Read `stream` in blocks of whole lines, each ending with a LF."""
+    rest = ""
+    while True:
+        data = stream.read(size)
+        if not data: break
+        data = rest + data
+        p = data.rfind("\n") + 1
+        (rest, data) = (data[p:], data[:p])
+        if data: yield data
+    if rest: yield rest + "\n"
+
+
+def _mapblocks(path, size=1 << 20, encoding=None, errors=None):
+    """Read a file through mmap in blocks of whole lines, as _blocks()."""
+    with open(path, "rb") as in_:
+        try:
+            data = mmap.mmap(in_.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            return
+    with data:
+        (p, end) = (0, len(data))
+        while p < end:
+            q = data.find(b"\n", p + size)
+            q = end if q < 0 else q + 1
+            block = data[p:q].decode(encoding or "utf-8", errors or "strict")
+            if os.name == "nt":  # as sys.stdin in universal newlines mode
+                block = block.replace("\r\n", "\n").replace("\r", "\n")
+            if not block.endswith("\n"): block += "\n"
+            yield block
+            p = q
+
+
+def _initworker(cache=0, profile=False, namesfiles=(NAMESFILE,)):
+    set_cache(cache)
+    set_stats(profile)
+    if namesfiles != _namesfiles: set_names(*namesfiles[1:])
+
+
+def _pipeline(convert, blocks, jobs=1, cache=0, profile=False):
+    """Yield `convert(block)` for each block, using `jobs` processes."""
+    if jobs <= 1:
+        yield from map(convert, blocks)
         return
-    for line in sys.stdin:
-        print(" ".join(kana(word, mofa, long_h) for word in line.split()))
+    import multiprocessing
+    from collections import deque
+    with multiprocessing.Pool(jobs, _initworker,
+                              (cache, profile, _namesfiles)) as pool:
+        pending = deque()
+        for block in blocks:
+            pending.append(pool.apply_async(convert, (block,)))
+            if len(pending) > 2 * jobs:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+STAGES = (  # (stage, object, attribute)
+    ("romanizer", "Romanizer", "__call__"),
+    ("h2k", None, "h2k"),
+    ("names", "Romanizer", "_name"),
+    ("fallback", None, "_roma"),
+    ("preroma", None, "_preroma"),
+    ("iso3602", None, "_iso3602"),
+    ("m4n", None, "_m4n"),
+    ("longvowel", None, "_longvowel"),
+    ("makecomposite", None, "makecomposite"),
+    ("katakana", "Deromanizer", "__call__"),
+    ("kanabuffer", "Deromanizer", "buffer"),
+    )
+_stats = None
+_statslock = threading.Lock()
+_unprofiled = threading.local()
+
+
+@contextlib.contextmanager
+def _noprofile():
+    """Suspend profiling in this thread, e.g. while compiling tables."""
+    saved = getattr(_unprofiled, "on", False)
+    _unprofiled.on = True
+    try:
+        yield
+    finally:
+        _unprofiled.on = saved
+
+
+def _profiled(stage, func):
+    def profiled(*args, **kwargs):
+        if getattr(_unprofiled, "on", False): return func(*args, **kwargs)
+        t = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            t = time.perf_counter() - t
+            with _statslock:
+                record = _stats[stage]
+                record["calls"] += 1
+                record["seconds"] += t
+        if stage == "names":
+            with _statslock:
+                record["misses" if result is None else "hits"] += 1
+        return result
+    profiled.__wrapped__ = func
+    profiled.__doc__ = func.__doc__
+    return profiled
+
+
+def set_stats(enable=True):
+    """Enable or disable per-stage profiling of roma().
+
+    While enabled, functions for each stage are replaced by wrappers
+    which count calls and accumulate time; they are restored when
+    disabled, so profiling costs nothing otherwise.
+    """
+    global _stats
+    with _statslock:
+        for (stage, owner, attr) in STAGES:
+            owner = globals()[owner] if owner else sys.modules[__name__]
+            func = getattr(owner, attr)
+            if enable and not hasattr(func, "__wrapped__"):
+                func = _profiled(stage, func)
+            elif not enable:
+                func = getattr(func, "__wrapped__", func)
+            setattr(owner, attr, func)
+        if enable and _stats is None:
+            _stats = dict((stage, dict(calls=0, seconds=0.0))
+                          for (stage, owner, attr) in STAGES)
+            _stats["names"].update(hits=0, misses=0)
+        elif not enable:
+            _stats = None
+
+
+def stats():
+    """Return per-stage profile of roma(); see set_stats().
+
+    Each stage has the number of calls and the cumulative time in
+    seconds, including those of nested stages, e.g. 'romanizer' includes
+    'h2k'.  'names' also has hits and misses of the names dictionary.
+
+    Test:
+    >>> set_stats()
+    >>> assert roma("やまだ", name=True) == "YAMADA"
+    >>> assert roma("ゔぃゔぁるでぃ", "HEPBURN", name=True) == "VIVARUDI"
+    >>> s = stats()
+    >>> assert s["romanizer"]["calls"] == 2
+    >>> assert Romanizer("RAIL")("しんばし") == "SHIMBASHI"
+    >>> assert stats()["preroma"] == s["preroma"]  # compiling is excluded
+    >>> assert (s["names"]["hits"], s["names"]["misses"]) == (1, 1)
+    >>> set_stats(False)
+    >>> assert stats() == dict()
+    """
+    with _statslock:
+        if not _stats: return dict()
+        return dict((k, dict(v)) for (k, v) in _stats.items())
+
+
+def stats_clear():
+    """Reset the per-stage profile."""
+    with _statslock:
+        if not _stats: return
+        for record in _stats.values():
+            for k in record:
+                record[k] = type(record[k])()
+
+
+def _mergestats(total, part):
+    for (stage, record) in part.items():
+        for (k, v) in record.items():
+            total.setdefault(stage, dict()).setdefault(k, 0)
+            total[stage][k] += v
+
+
+def _statsblock(block, convert):
+    stats_clear()
+    before = cache_info()
+    block = convert(block)
+    after = cache_info()
+    profile = stats()
+    profile["cache"] = dict(hits=after.hits - before.hits,
+                            misses=after.misses - before.misses)
+    return (block, profile)
+
+
+def _drain(convert, blocks, out, jobs, args):
+    """Write converted blocks to `out`, and the profile if --stats."""
+    profile = args["--stats"]
+    if profile:
+        convert = functools.partial(_statsblock, convert=convert)
+        total = dict()
+    cache = int(args["--cache"])
+    for block in _pipeline(convert, blocks, jobs, cache, profile):
+        if profile:
+            (block, part) = block
+            _mergestats(total, part)
+        out.write(block)
+    if profile: _printstats(total)
+
+
+def _printstats(profile, out=sys.stderr):
+    print("{:<16}{:>12}{:>14}".format("stage", "calls", "seconds"), file=out)
+    for (stage, owner, attr) in STAGES:
+        record = profile.get(stage)
+        if not record: continue
+        print("{:<16}{:>12}{:>14.6f}".format(
+                stage, record["calls"], record["seconds"]), file=out)
+    if "names" in profile:
+        print("names: {hits} hits, {misses} misses".format(
+                **profile["names"]), file=out)
+    if sum(profile.get("cache", dict()).values()):
+        print("cache: {hits} hits, {misses} misses".format(
+                **profile["cache"]), file=out)
+
+
+FORMATS = ("text", "csv", "tsv", "jsonl")
+COLUMNSEP = "\x1f"  # separates columns of --systems in records
+
+
+def _dialect(fmt):
+    return csv.excel_tab if fmt == "tsv" else csv.excel
+
+
+def _readrecords(stream, fmt, size=10000):
+    """Yield lists of up to `size` records read from `stream`."""
+    if fmt == "jsonl":
+        records = (json.loads(line) for line in stream if line.strip())
+    else:
+        records = csv.reader(stream, _dialect(fmt))
+    while True:
+        batch = list(itertools.islice(records, size))
+        if not batch: return
+        yield batch
+
+
+def _records_block(batch, convert, fmt="csv", fields=None, append=None):
+    """Convert fields of records, converting each distinct value once.
+
+    batch       (list) records; lists for CSV/TSV, dicts for JSON Lines
+    convert     (callable) converter of a block of lines
+    fields      (list) column numbers or keys to convert; None for all
+    append      (str) suffix of keys for converted fields in JSON Lines,
+                or True for CSV/TSV, to append instead of replacing
+                (list) suffixes of fields to append for each of columns
+                separated by COLUMNSEP in the converted lines
+    """
+    if fields is not None:  # numbers are 0-based for arrays, as in CSV
+        positions = [f if isinstance(f, int) else int(f) - 1
+                     for f in fields if isinstance(f, int) or f.isdigit()]
+
+    def selected(record):
+        if isinstance(record, dict): (keys, wanted) = (record, fields)
+        elif isinstance(record, list):
+            (keys, wanted) = (range(len(record)), fields and positions)
+        else: return []  # scalars in JSON Lines are passed through
+        if fields is not None:
+            keys = [k for k in wanted if k in keys]
+        return [k for k in keys if isinstance(record[k], str)]
+
+    values = sorted(set(record[k] for record in batch
+                        for k in selected(record)))
+    lines = [v.split("\n") for v in values]
+    block = "".join(line + "\n" for ll in lines for line in ll)
+    converted = iter(convert(block).split("\n"))
+    table = dict((v, [next(converted) for _ in ll])
+                 for (v, ll) in zip(values, lines))
+    if isinstance(append, list):
+        for (v, ll) in table.items():
+            table[v] = list(map("\n".join, zip(*(line.split(COLUMNSEP)
+                                                 for line in ll))))
+    else:
+        for (v, ll) in table.items():
+            table[v] = "\n".join(ll)
+    buf = io.StringIO()
+    if fmt != "jsonl":
+        writer = csv.writer(buf, _dialect(fmt), lineterminator="\n")
+    for record in batch:
+        keys = selected(record)
+        if not keys:
+            pass
+        elif isinstance(append, list):
+            columns = [(k, s, x) for k in keys
+                       for (s, x) in zip(append, table[record[k]])]
+            if isinstance(record, dict):
+                record.update((k + s, x) for (k, s, x) in columns)
+            else:
+                record = record + [x for (k, s, x) in columns]
+        elif append and isinstance(record, dict):
+            record.update((k + append, table[record[k]]) for k in keys)
+        elif append:
+            record = record + [table[record[k]] for k in keys]
+        else:
+            for k in keys:
+                record[k] = table[record[k]]
+        if fmt == "jsonl":
+            buf.write(json.dumps(record, ensure_ascii=False) + "\n")
+        else:
+            writer.writerow(record)
+    return buf.getvalue()
+
+
+def _piperecords(convert, args, in_, out, jobs, suffix=""):
+    """Convert fields of CSV/TSV/JSON Lines records from `in_` to `out`.
+
+    Converted fields are split into words as text is, so that leading,
+    trailing and repeated whitespace is not kept unless with --mixed.
+    JSON Lines values other than objects and arrays are passed through.
+
+    Test:
+    >>> import docopt
+    >>> def run(argv, text):
+    ...     args = docopt.docopt(__doc__.format(script="romaja"),
+    ...                          argv.split())
+    ...     (stdin, sys.stdin) = (sys.stdin, io.StringIO(text))
+    ...     try: romaja(args)
+    ...     finally: sys.stdin = stdin
+    >>> run("-f csv --header --fields kana", "id,kana,memo\\n1,かんだ,か\\n")
+    id,kana,memo
+    1,KANDA,か
+    >>> run("-f csv --fields 2", "1,しんばし\\n")
+    1,SHINBASHI
+    >>> run("-f csv --header --append", 'kana\\n"やまだ\\nたろう"\\n')
+    kana,kana_roma
+    "やまだ
+    たろう","YAMADA
+    TARO~"
+    >>> run("-f csv --header -S ansi,hepburn", "kana\\nしんばし\\n")
+    kana,kana_ansi,kana_hepburn
+    しんばし,SHINBASHI,SHIMBASHI
+    >>> run("-f jsonl --append --fields kana",
+    ...     '5\\n"か"\\nnull\\n["か"]\\n{"kana": "か", "n": 1}\\n')
+    5
+    "か"
+    null
+    ["か"]
+    {"kana": "か", "n": 1, "kana_roma": "KA"}
+    >>> run("-f jsonl -S ansi,hepburn", '["しんばし", 1]\\n')
+    ["しんばし", 1, "SHINBASHI", "SHIMBASHI"]
+    >>> run("-f jsonl --fields 2,kana", '["か", "き"]\\n{"kana": "く"}\\n')
+    ["か", "KI"]
+    {"kana": "KU"}
+    >>> run("-f csv --header --fields nope", "kana\\nか\\n")
+    Traceback (most recent call last):
+    ValueError: no such fields in the header: nope
+    >>> run("-f csv --fields 0", "か\\n")
+    Traceback (most recent call last):
+    ValueError: field numbers start at 1: 0
+    >>> run("-f csv", "やまだ  たろう\\n")
+    YAMADA TARO~
+    >>> run("-f csv -m", "やまだ  たろう\\n")
+    YAMADA  TARO~
+    """
+    fmt = args["--format"].lower()
+    fields = args["--fields"]
+    if fields:
+        fields = [f.strip() for f in fields.split(",")]
+        for f in fields:
+            if f.isdigit() and int(f) < 1:
+                raise ValueError("field numbers start at 1: " + f)
+    batches = _readrecords(in_, fmt)
+    if fmt != "jsonl":
+        header = None
+        if args["--header"]:
+            batch = next(batches, [])
+            if batch: header = batch.pop(0)
+            batches = itertools.chain([batch], batches)
+        if fields:
+            if header is None and not all(f.isdigit() for f in fields):
+                raise ValueError("field names require --header")
+            missing = [f for f in fields
+                       if not f.isdigit() and f not in header]
+            if missing:
+                raise ValueError("no such fields in the header: " +
+                                 ",".join(missing))
+            fields = [int(f) - 1 if f.isdigit() else header.index(f)
+                      for f in fields]
+        if header is not None:
+            keys = fields or range(len(header))
+            if isinstance(suffix, list):
+                header += [header[k] + s for k in keys for s in suffix]
+            elif args["--append"]:
+                header += [header[k] + suffix for k in keys]
+            csv.writer(out, _dialect(fmt), lineterminator="\n"
+                       ).writerow(header)
+    append = args["--append"] and (suffix if fmt == "jsonl" else True)
+    if isinstance(suffix, list): append = suffix
+    convert = functools.partial(_records_block, convert=convert, fmt=fmt,
+                                fields=fields, append=append)
+    _drain(convert, batches, out, jobs, args)
+
+
+def _pipe(convert, args, suffix=""):
+    jobs = int(args["--jobs"]) or os.cpu_count() or 1
+    fmt = args["--format"].lower()
+    if fmt not in FORMATS:
+        raise ValueError("valid formats are: " + ",".join(FORMATS))
+    out = sys.stdout
+    if args["--output"]:
+        out = open(args["--output"], "w", encoding=sys.stdout.encoding,
+                   errors=sys.stdout.errors, buffering=1 << 20)
+    try:
+        if fmt != "text" and args["--input"]:
+            with open(args["--input"], "r", encoding=sys.stdin.encoding,
+                      errors=sys.stdin.errors, newline="") as in_:
+                _piperecords(convert, args, in_, out, jobs, suffix)
+            return
+        if fmt != "text":
+            _piperecords(convert, args, sys.stdin, out, jobs, suffix)
+            return
+        if args["--input"]:
+            blocks = _mapblocks(args["--input"], encoding=sys.stdin.encoding,
+                                errors=sys.stdin.errors)
+        else:
+            blocks = _blocks(sys.stdin)
+        _drain(convert, blocks, out, jobs, args)
+    finally:
+        if out is not sys.stdout: out.close()
+
+
+def _serveone(request):
+    """Return the result of a request of `romaja serve`."""
+    op = request.get("op", "roma")
+    text = request["text"]
+    if op in ("roma", "roma_text"):
+        return globals()[op](text, request.get("system", "ANSI"),
+                             request.get("composite", False),
+                             request.get("name", False),
+                             request.get("normalize", False),
+                             request.get("case", "upper"))
+    if op == "roma_all":
+        return roma_all(text, request.get("systems", ("ANSI", "ISO",
+                                                      "HEPBURN", "MOFA")),
+                        request.get("composite", False),
+                        request.get("name", False),
+                        request.get("case", "upper"))
+    if op == "roma_fullname":
+        return roma_fullname(text, request.get("system", "ANSI"),
+                             request.get("composite", False),
+                             request.get("case", "upper"))
+    if op in ("katakana", "hiragana"):
+        return globals()[op](text, request.get("mofa", False),
+                             request.get("long_h", False))
+    raise ValueError("unknown op: {}".format(op))
+
+
+def _servebatch(batch):
+    """Return responses to a batch of requests without their ids."""
+    responses = []
+    for request in batch:
+        try:
+            responses.append(dict(result=_serveone(request)))
+        except Exception as e:
+            responses.append(dict(error="{}: {}".format(
+                    type(e).__name__, e)))
+    return responses
+
+
+def _percentiles(latencies):
+    """Return count and percentiles in milliseconds of `latencies`."""
+    result = dict(requests=len(latencies))
+    if not latencies: return result
+    latencies = sorted(latencies)
+    for p in (50, 90, 99, 99.9):
+        k = min(len(latencies) - 1, int(len(latencies) * p / 100))
+        result["p{:g}".format(p)] = latencies[k] * 1000
+    result["max"] = latencies[-1] * 1000
+    return result
+
+
+class _Server:
+
+    """Front end of `romaja serve`.
+
+    Requests which arrive while a batch is being converted are grouped
+    into the next batch, up to `maxbatch` requests, so that a busy
+    server converts many requests per round trip to the workers while
+    an idle one answers each request at once.
+    """
+
+    def __init__(self, executor=None, jobs=1, maxbatch=256):
+        import asyncio
+        from collections import deque
+        self.executor = executor
+        self.maxbatch = maxbatch
+        self.pending = deque()
+        self.ready = asyncio.Event()
+        self.slots = asyncio.Semaphore(max(jobs, 1))
+        self.latencies = deque(maxlen=100000)
+        self.started = time.time()
+
+    async def dispatch(self):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            while self.pending:
+                await self.slots.acquire()
+                batch = [self.pending.popleft() for _ in
+                         range(min(self.maxbatch, len(self.pending)))]
+                requests = [request for (request, future) in batch]
+                if self.executor is None:
+                    self.settle(batch, _servebatch(requests))
+                    self.slots.release()
+                    await asyncio.sleep(0)
+                else:
+                    future = loop.run_in_executor(
+                            self.executor, _servebatch, requests)
+                    future.add_done_callback(functools.partial(
+                            self.settled, batch))
+
+    def settle(self, batch, responses):
+        for ((request, future), response) in zip(batch, responses):
+            if not future.done(): future.set_result(response)
+
+    def settled(self, batch, future):
+        self.slots.release()
+        try:
+            self.settle(batch, future.result())
+        except Exception as e:
+            for (request, f) in batch:
+                if not f.done(): f.set_exception(e)
+
+    def submit(self, request):
+        import asyncio
+        future = asyncio.get_running_loop().create_future()
+        if request.get("op") == "stats":
+            future.set_result(dict(result=self.stats()))
+        else:
+            self.pending.append((request, future))
+            self.ready.set()
+        return future
+
+    def stats(self):
+        result = _percentiles(self.latencies)
+        result["uptime"] = time.time() - self.started
+        return result
+
+    async def handle(self, reader, writer):
+        import asyncio
+        responses = asyncio.Queue()
+        sender = asyncio.ensure_future(self.send(responses, writer))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line: break
+                start = time.perf_counter()
+                try:
+                    request = json.loads(line.decode("utf-8"))
+                    if not isinstance(request, dict):
+                        raise ValueError("request must be an object")
+                    future = self.submit(request)
+                except ValueError as e:
+                    (request, future) = (dict(), asyncio.Future())
+                    future.set_result(dict(error="{}: {}".format(
+                            type(e).__name__, e)))
+                await responses.put((request.get("id"), future, start))
+        finally:
+            await responses.put(None)
+            await sender
+
+    async def send(self, responses, writer):
+        while True:
+            item = await responses.get()
+            if item is None: break
+            (id_, future, start) = item
+            response = dict(id=id_)
+            response.update(await future)
+            writer.write(json.dumps(response, ensure_ascii=False)
+                         .encode("utf-8") + b"\n")
+            self.latencies.append(time.perf_counter() - start)
+            if responses.empty(): await writer.drain()
+        writer.close()
+
+
+def serve(args):
+    """Run `romaja serve` until interrupted."""
+    import asyncio
+    if not (args["--socket"] or args["--port"]):
+        raise ValueError("serve requires --socket or --port")
+    set_cache(int(args["--cache"]))
+    if args["--names"]: set_names(*args["--names"].split(os.pathsep))
+    jobs = int(args["--jobs"])
+    if jobs <= 0: jobs = os.cpu_count() or 1
+    executor = None
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(
+                jobs, initializer=_initworker,
+                initargs=(int(args["--cache"]), False, _namesfiles))
+    for system in RECIPE: _romanizer(system)  # warm up the tables
+    names().tries()
+    server = None
+
+    async def run():
+        # asyncio objects of the server must be made in the running loop.
+        nonlocal server
+        server = _Server(executor, jobs, int(args["--batch"]))
+        asyncio.ensure_future(server.dispatch())
+        if args["--socket"]:
+            listener = await asyncio.start_unix_server(
+                    server.handle, args["--socket"])
+        else:
+            listener = await asyncio.start_server(
+                    server.handle, args["--host"], int(args["--port"]))
+        async with listener:
+            await listener.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args["--socket"] and os.path.exists(args["--socket"]):
+            os.remove(args["--socket"])
+        if executor is not None: executor.shutdown()
+        if args["--stats"] and server is not None:
+            print(json.dumps(server.stats()), file=sys.stderr)
 
 
 def getargs():
+    import docopt
     return docopt.docopt(__doc__.format(script=os.path.basename(__file__)),
                          version=__version__)
 
@@ -499,6 +2794,7 @@ def jaroma_main():
 def main():
     args = getargs()
     if args["--test"]: dotest()
+    elif args["serve"]: serve(args)
     elif args["--reverse"]: jaroma(args)
     else: romaja(args)
 
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# vim: set fileencoding=utf-8 fileformat=unix :
+
+# Copyright (C) 2013 HAYASHI Hideki <hideki@hayasix.com>  All rights reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL). A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+
+"""{script}: Verify outputs and throughput of romaja against a snapshot
+
+Usage: {script} [options]
+
+Options:
+  -h, --help            show this
+  -j, --jobs N          verify in N processes; 0 for all CPUs [default: 0]
+  -g, --golden FILE     golden snapshot of outputs; verify.golden.gz
+                        beside {script} if omitted
+  -b, --baseline FILE   baseline of throughput; verify.baseline.json
+                        beside {script} if omitted
+  -t, --threshold PCT   fail if throughput drops by more than PCT percent
+                        from the baseline [default: 20]
+  --update              record the baseline, and the snapshot if --golden
+                        is given, instead of verifying against them
+
+Every name in names.csv and every mora, alone and next to the kana
+which affect its romanization, is converted by roma() for each system,
+with and without composite chars and name conversion, and the results
+are converted back by katakana().  All of the outputs must be identical
+to those in the golden snapshot, and the throughput in conversions per
+second per process must not drop by more than the threshold.  The
+snapshot is distributed with romaja; the baseline depends on the
+machine and is recorded locally by --update, which records the snapshot
+as well only if --golden is given; without it, throughput is not
+checked and a warning is printed.  Mismatches, including words missing
+in the snapshot, are reported with their inputs, and the exit status is
+1 if verification fails.
+"""
+
+
+import sys
+import os
+import gzip
+import io
+import json
+import platform
+import time
+
+import docopt
+
+import romaja
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GOLDEN = os.path.join(HERE, "verify.golden.gz")
+BASELINE = os.path.join(HERE, "verify.baseline.json")
+SMALLKANA = "ャュョァィゥェォヮ"
+CONTEXTS = "ンッーアイウエオヤユヨバマパ"
+SPECS = [(system, composite, name) for system in romaja.RECIPE
+         for (composite, name) in ((False, False), (True, False),
+                                   (False, True))]
+CHUNK = 500
+
+
+def columns():
+    """Return the names of outputs for each word."""
+    result = []
+    for (system, composite, name) in SPECS:
+        spec = system + (".composite" if composite else "") + (
+                ".name" if name else "")
+        result += ["roma." + spec, "kana." + spec]
+    return result
+
+
+def morae():
+    """Return every mora in Katakana, with small kana, ン, ッ and ー."""
+    plain = [k for k in romaja.KR if k != "〓"] + ["ヴ"]
+    return (plain + [k + s for k in plain for s in SMALLKANA] +
+            list("ンッー"))
+
+
+def corpus():
+    """Return names in names.csv and the mora corpus without duplicates."""
+    mm = morae()
+    words = list(romaja.names()) + mm
+    words += [m + c for m in mm for c in CONTEXTS]
+    words += [c + m for c in "ンッ" for m in mm]
+    return list(dict.fromkeys(words))
+
+
+def convert(words):
+    """Return outputs for `words`, CPU time taken and the conversions."""
+    t = time.process_time()
+    rows = []
+    for word in words:
+        row = [word]
+        for (system, composite, name) in SPECS:
+            romaji = romaja.roma(word, system, composite, name)
+            row += [romaji, romaja.katakana(romaji)]
+        rows.append(row)
+    return (rows, time.process_time() - t, len(words) * len(SPECS) * 2)
+
+
+def run(words, jobs):
+    """Return outputs for `words` and throughput per process."""
+    chunks = [words[p:p + CHUNK] for p in range(0, len(words), CHUNK)]
+    if jobs > 1:
+        import multiprocessing
+        with multiprocessing.Pool(jobs) as pool:
+            results = pool.map(convert, chunks)
+    else:
+        results = list(map(convert, chunks))
+    rows = [row for (part, seconds, count) in results for row in part]
+    seconds = sum(seconds for (part, seconds, count) in results)
+    count = sum(count for (part, seconds, count) in results)
+    return (rows, count / seconds)
+
+
+def save(rows, golden):
+    # No name or mtime in the header keeps the snapshot reproducible.
+    with open(golden, "wb") as raw, \
+            gzip.GzipFile("", "wb", fileobj=raw, mtime=0) as gz, \
+            io.TextIOWrapper(gz, encoding="utf-8", newline="\n") as out:
+        out.write("\t".join(["word"] + columns()) + "\n")
+        for row in rows:
+            out.write("\t".join(row) + "\n")
+
+
+def savebaseline(rows, throughput, baseline):
+    with open(baseline, "w") as out:
+        json.dump(dict(
+                version=romaja.__version__,
+                python=platform.python_version(),
+                implementation=platform.python_implementation(),
+                machine=platform.machine(),
+                words=len(rows),
+                conversions_per_sec=throughput), out, indent=2)
+
+
+def compare(rows, golden, out=sys.stdout):
+    """Report outputs not matching `golden`; return the number of them."""
+    with gzip.open(golden, "rt", encoding="utf-8") as in_:
+        header = in_.readline().rstrip("\n").split("\t")
+        expected = dict()
+        for line in in_:
+            row = line.rstrip("\n").split("\t")
+            expected[row[0]] = row
+    index = dict((col, k) for (k, col) in enumerate(["word"] + columns()))
+    cols = [(col, k, index[col]) for (k, col) in enumerate(header)
+            if k and col in index]
+    mismatches = 0
+    for row in rows:
+        old = expected.get(row[0])
+        if old is None:
+            mismatches += 1
+            print("{}\tnot in the snapshot".format(row[0]), file=out)
+            continue
+        for (col, k, i) in cols:
+            if old[k] != row[i]:
+                mismatches += 1
+                print("{}\t{}\texpected {}\tgot {}".format(
+                        row[0], col, old[k], row[i]), file=out)
+    return mismatches
+
+
+def main():
+    args = docopt.docopt(__doc__.format(script=os.path.basename(__file__)))
+    jobs = int(args["--jobs"]) or os.cpu_count() or 1
+    golden = args["--golden"] or GOLDEN
+    baseline = args["--baseline"] or BASELINE
+    words = corpus()
+    (rows, throughput) = run(words, jobs)
+    print("{} words, {:.0f} conversions/sec per process".format(
+            len(rows), throughput))
+    if args["--update"]:
+        if args["--golden"]:
+            save(rows, golden)
+        savebaseline(rows, throughput, baseline)
+        return 0
+    if not os.path.exists(golden):
+        print("no snapshot: " + golden, file=sys.stderr)
+        return 1
+    failed = False
+    mismatches = compare(rows, golden)
+    if mismatches:
+        print("{} outputs differ from the snapshot".format(mismatches))
+        failed = True
+    if os.path.exists(baseline):
+        with open(baseline) as in_:
+            baseline = json.load(in_)["conversions_per_sec"]
+        change = (throughput / baseline - 1) * 100
+        print("throughput {:+.1f}% from the baseline".format(change))
+        if change < -float(args["--threshold"]):
+            print("throughput dropped by more than {}%".format(
+                    args["--threshold"]))
+            failed = True
+    else:
+        print("warning: throughput not checked without a baseline; "
+              "record it with --update", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())